@@ -0,0 +1,84 @@
+import psycopg2, sys
+from itertools import groupby
+from operator import itemgetter
+
+# Converts the old lineups table (one row per play) into lineup_stints (one
+# row per run of plays in a section with the same lineups). Games that already
+# have stints are skipped, so this can be stopped and run again. Plays with no
+# lineups row end a stint and are left out, and the site will find their
+# lineups when the game is next loaded.
+# Run with --drop to drop the lineups table once every game is converted.
+
+GAMES_PER_COMMIT = 100
+
+conn = psycopg2.connect("dbname=game_data user=michael")
+cur = conn.cursor()
+
+# list of tuples (game_id, play_id, time, section, home_lineup, away_lineup)
+#                                                   -> returns list of tuples
+def make_stints(rows):
+    """Group one game's plays into stint rows for lineup_stints."""
+    stints = []
+    stint = None
+    for game_id, play_id, time, section, home_lineup, away_lineup in rows:
+        if home_lineup is None or away_lineup is None:
+            stint = None
+            continue
+        # Arrays were written in set order, so compare them as sets.
+        lineups = (frozenset(home_lineup), frozenset(away_lineup))
+        if stint is not None and stint[1] == section and stint[8] == lineups:
+            stint[3] = play_id
+            stint[5] = time
+        else:
+            stint = [game_id, section, play_id, play_id, time, time,
+                     sorted(lineups[0]), sorted(lineups[1]), lineups]
+            stints += [stint]
+    return [tuple(stint[:8]) for stint in stints]
+
+cur.execute("""
+    SELECT DISTINCT pbp.game_id
+    FROM lineups L JOIN play_by_plays pbp ON L.play_id = pbp.play_id
+    WHERE NOT EXISTS (SELECT 1 FROM lineup_stints S
+                      WHERE S.game_id = pbp.game_id)
+    ORDER BY pbp.game_id""")
+game_ids = [row[0] for row in cur.fetchall()]
+print str(len(game_ids)) + " games to convert"
+
+for i in range(0, len(game_ids), GAMES_PER_COMMIT):
+    batch = tuple(game_ids[i:i + GAMES_PER_COMMIT])
+    # A named cursor streams the plays rather than fetching them all at once.
+    read_cur = conn.cursor("lineups_to_convert")
+    read_cur.execute("""
+        SELECT pbp.game_id, pbp.play_id, pbp.time, pbp.section,
+            L.home_lineup, L.away_lineup
+        FROM play_by_plays pbp LEFT JOIN lineups L
+            ON pbp.play_id = L.play_id
+        WHERE pbp.game_id IN %s ORDER BY pbp.game_id, pbp.play_id""",
+        (batch,))
+    all_stints = []
+    for game_id, rows in groupby(read_cur, key=itemgetter(0)):
+        all_stints += make_stints(rows)
+    read_cur.close()
+    cur.executemany("""
+        INSERT INTO lineup_stints (game_id, section, first_play_id,
+            last_play_id, start_time, end_time, home_lineup, away_lineup)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)""",
+        all_stints)
+    conn.commit()
+    print ("converted " + str(min(i + GAMES_PER_COMMIT, len(game_ids))) +
+           " games, " + str(len(all_stints)) + " stints in this batch")
+
+cur.execute("""
+    SELECT pg_total_relation_size('lineups'),
+        pg_total_relation_size('lineup_stints')""")
+lineups_size, stints_size = cur.fetchone()
+print "lineups: " + str(lineups_size // 1024) + " KB"
+print "lineup_stints: " + str(stints_size // 1024) + " KB"
+
+if "--drop" in sys.argv[1:]:
+    cur.execute("DROP TABLE lineups")
+    conn.commit()
+    print "dropped lineups"
+
+cur.close()
+conn.close()
@@ -0,0 +1,167 @@
+from __future__ import division
+from collections import defaultdict
+try:
+    import numpy
+except ImportError:
+    numpy = None # Without it, type totals are summed in Python.
+
+# Types made of other types, which no action has itself.
+SUPERTYPES = {"FGA": ("made_2FG", "missed_2FG", "made_3FG", "missed_3FG"),
+              "FTA": ("made_FT", "missed_FT"),
+              "FGM": ("made_2FG", "made_3FG")}
+
+# {frozenset of (int, string, int) (see get_catalog()): ActionCatalog}
+catalogs = {}
+# {(int, int) (id and length of an actions dict): (dict, ActionCatalog)}. The
+# dicts looked up lately, so get_catalog() is O(1) for them. Each dict is
+# kept alive while it's here (so its id can't be reused), so only the last
+# MAX_DICTS_KEPT are.
+catalogs_by_dict = {}
+MAX_DICTS_KEPT = 16
+
+class ActionCatalog:
+    """Lookups between actions and their types, made once from the actions.
+
+        Finding the actions of a type used to mean scanning every action each
+    time. Here each type (including the SUPERTYPES) maps to its actions, and
+    a dense incidence matrix of types by actions turns a count of each action
+    into the total of every type with one matrix-vector product (see
+    type_totals()). Nothing is changed after it's made, so one catalog is
+    shared by everything using the same actions (see get_catalog()).
+
+        Instance attributes:
+    actions_attributes: {int (action id): {see StatsObject}}.
+    type_of_id: {int (action id): string}.
+    first_id_of_type: {string: int (action id)}. The first action of each type
+        in actions_attributes' order, as get_one_id_matching_type() found it.
+    ids_of_type: {string: frozenset of ints (action ids)}.
+    action_ids: tuple of ints. The columns of the incidence matrix.
+    types: tuple of strings. Its rows.
+    column: {int (action id): int}. Each action's column.
+    incidence: NumPy int array of shape (types, action_ids), or None without
+        NumPy. 1 where the action is of the type.
+    points: NumPy int array of each action's points, or None without NumPy.
+    """
+
+    # {int: {see StatsObject}} -> [void]
+    def __init__(self, actions_attributes):
+        self.actions_attributes = actions_attributes
+        self.type_of_id = {}
+        self.first_id_of_type = {}
+        ids_of_type = {}
+        for action_id, attrs in actions_attributes.iteritems():
+            self.type_of_id[action_id] = attrs["type"]
+            self.first_id_of_type.setdefault(attrs["type"], action_id)
+            ids_of_type.setdefault(attrs["type"], set()).add(action_id)
+        for supertype, types in SUPERTYPES.iteritems():
+            ids_of_type[supertype] = set()
+            for action_type in types:
+                ids_of_type[supertype].update(ids_of_type.get(action_type, ()))
+        self.ids_of_type = {action_type: frozenset(ids)
+                            for action_type, ids in ids_of_type.iteritems()}
+
+        self.action_ids = tuple(sorted(actions_attributes))
+        self.types = tuple(sorted(self.ids_of_type))
+        self.column = {a_id: j for j, a_id in enumerate(self.action_ids)}
+        self.incidence = None
+        self.points = None
+        if numpy is not None:
+            self.incidence = numpy.zeros((len(self.types), len(self.action_ids)),
+                                         numpy.int64)
+            for i, action_type in enumerate(self.types):
+                for a_id in self.ids_of_type[action_type]:
+                    self.incidence[i, self.column[a_id]] = 1
+            self.points = numpy.array([actions_attributes[a_id]["points"]
+                                       for a_id in self.action_ids], numpy.int64)
+
+    # string -> returns frozenset of ints
+    def get_ids(self, *action_types):
+        """The action IDs of any of the types given."""
+
+        if len(action_types) == 1:
+            return self.ids_of_type.get(action_types[0], frozenset())
+        ids = set()
+        for action_type in action_types:
+            ids.update(self.ids_of_type.get(action_type, ()))
+        return frozenset(ids)
+
+    # {int (action ID): int} -> returns {string: int}
+    def type_totals(self, actions_totals):
+        """The total of every type (including supertypes) in actions_totals.
+
+            Like actions_totals, it's a defaultdict, so types no action has
+        are 0.
+        """
+
+        if self.incidence is None:
+            return defaultdict(int, {
+                action_type: sum(actions_totals.get(a_id, 0)
+                                 for a_id in self.ids_of_type[action_type])
+                for action_type in self.types})
+        totals = self.incidence.dot(self.count_vector(actions_totals))
+        return defaultdict(int, zip(self.types, totals.tolist()))
+
+    # {int (action ID): int} -> returns int
+    def total_points(self, actions_totals):
+        """The points of all the actions in actions_totals."""
+
+        if self.points is None:
+            return sum(total * self.actions_attributes[a_id]["points"]
+                       for a_id, total in actions_totals.iteritems())
+        return int(self.points.dot(self.count_vector(actions_totals)))
+
+    # {int (action ID): int} -> NumPy int array
+    def count_vector(self, actions_totals):
+        """actions_totals as a vector over action_ids."""
+
+        counts = numpy.zeros(len(self.action_ids), numpy.int64)
+        for a_id, total in actions_totals.iteritems():
+            counts[self.column[a_id]] = total
+        return counts
+
+# {int: {see StatsObject}} -> ActionCatalog
+def get_catalog(actions_attributes):
+    """The process's catalog of these actions, made the first time.
+
+        Catalogs are kept by what's in the actions (each one's id, type and
+    points), not by the dict, so every StatsObject and worker process with
+    the same actions shares one, and there's only one per set of actions.
+    Making that key walks every action, so a dict looked up lately is found
+    by its id and length first (see catalogs_by_dict). Actions dicts aren't
+    changed once loaded, other than by adding actions.
+    """
+
+    dict_key = (id(actions_attributes), len(actions_attributes))
+    if dict_key in catalogs_by_dict:
+        return catalogs_by_dict[dict_key][1]
+    key = frozenset((a_id, attrs["type"], attrs["points"])
+                    for a_id, attrs in actions_attributes.iteritems())
+    try:
+        catalog = catalogs[key]
+    except KeyError:
+        catalog = catalogs[key] = ActionCatalog(actions_attributes)
+    if len(catalogs_by_dict) >= MAX_DICTS_KEPT:
+        catalogs_by_dict.clear()
+    catalogs_by_dict[dict_key] = (actions_attributes, catalog)
+    return catalog
+
+# Just for debugging: time totalling every type of a dict of counts by
+# scanning the actions for each type, as before, and with the catalog.
+# int -> [void]
+def time_type_totals(repeats=1000):
+    import time
+    from StatsObject import StatsObject
+    SO = StatsObject()
+    catalog = get_catalog(SO.actions_attributes)
+    counts = {a_id: i % 7 for i, a_id in enumerate(SO.actions_attributes)}
+    start = time.time()
+    for i in range(repeats):
+        for action_type in catalog.types:
+            types = SUPERTYPES.get(action_type, (action_type,))
+            sum(counts[a_id] for a_id, attrs
+                in SO.actions_attributes.iteritems() if attrs["type"] in types)
+    print "scans:   {s:.3f}s".format(s=time.time() - start)
+    start = time.time()
+    for i in range(repeats):
+        catalog.type_totals(counts)
+    print "catalog: {s:.3f}s".format(s=time.time() - start)
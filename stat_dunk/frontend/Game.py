@@ -1,8 +1,17 @@
 from __future__ import division
+import itertools
 import psycopg2
+import weakref
+from bisect import bisect_left
 from operator import itemgetter
 import StatsObject
+from ActionCatalog import get_catalog
 from Play import Play
+from PlayStore import PlayStore, store_from_plays
+from Stint import Stint
+from Timeline import section_seconds
+
+STINT_ROWS_PER_INSERT = 1000
 
 """
 Game
@@ -14,6 +23,9 @@ class Game:
     """This stores all information about a given game.
     
         Instance attributes:
+    SO: a weak proxy of the StatsObject that loaded this Game. It's weak so a
+        Game kept in a GameCache doesn't keep that StatsObject alive. None
+        for Games made in a worker process (see build_game()).
     g_id: int. The database game_id.
     has_invalid_data: string. Empty strings evaluate to False. Replace this
         with a reason data is invalid if that's the case.
@@ -23,18 +35,44 @@ class Game:
         school ID and get the string which is a key for various internal
         lookups, such as the lineups in Play objects.
     roster: {int (player id):Player}. Both teams' rosters in one dict.
+    roster_order: list of Players in roster, ordered by player id.
+    roster_index: {Player: int}. Each Player's index in roster_order.
+    player_bits: {Player: int}. 1 << roster_index, so a lineup is an int
+        bitmask (see Play.lineup_mask and Question.lineup_is_correct).
     actions: {int (action id):string ("action")}.
-    plays: a list of Play objects. They will include lineups.
+    catalog: ActionCatalog of the actions, looked up once (see get_catalog()).
+    plays: a list of Play objects. They will include lineups. If the Game is
+        columnar, this is a PlayStore instead, made straight from the rows
+        when their lineups are all in the db, and Plays are only made when
+        asked for (see get_Plays()).
     lineups: a set of frozensets of Players. All unique lineups in plays.
     section_indices: {int: int}. The index of the first Play in a given
         section (the key).
+    section_masks: {int (section): int}. The bitmask of every Player in any
+        lineup in that section.
+    play_times: list (or array, if columnar) of each Play's time, by index.
+    play_masks: list of each Play's lineup_mask, by index.
+    play_store: PlayStore or None. The Plays as arrays for vectorized
+        Questions, made when first needed (see get_play_store()).
+    stints: {int (section): list of Stints}. The Plays of each section, in
+        runs with the same lineups (see Stint).
+    on_court_intervals: {int (section): (list of ints (starts), list of ints
+        (ends), {Player: int})}, or None until first needed (see
+        get_on_court_intervals()).
+    lineup_engine: string. How missing lineups are found: "nearest" (see
+        add_lineups()) or "substitutions" (see add_lineups_by_substitution()).
+    has_new_lineups: bool. Some lineups weren't in the lineup_stints table
+        and were found by add_lineups_to_game(), so the Stints are saved (by
+        the caller, if the rows were given), unless save_lineups is False.
     """
 
-    # connection, int, int, int, {int: Player}, {int: "action"} -> [void]
-    def __init__(self, SO, conn, g_id, home=None, away=None,
-                 roster=None, actions=None):
-        cur = conn.cursor()
-        self.SO = SO
+    # connection, int, int, int, {int: Player}, {int: "action"},
+    #     list of tuples, list of tuples, bool, string, bool, dict -> [void]
+    def __init__(self, SO, conn, g_id, home=None, away=None, roster=None,
+                 actions=None, rows=None, stint_rows=None, columnar=False,
+                 lineup_engine="nearest", save_lineups=True, payload=None):
+        cur = conn.cursor() if conn is not None else None
+        self.SO = weakref.proxy(SO) if SO is not None else None
         self.g_id = g_id
         self.has_invalid_data = ""
         if home is None or away is None:
@@ -48,30 +86,242 @@ class Game:
         else:
             self.roster = dict(make_dict_of_players(home),
                                **make_dict_of_players(away))
+        self.index_roster()
         if actions:
             self.actions_attributes = actions
         else:
             self.actions_attributes = self.SO.make_action_attrs()
+        self.catalog = get_catalog(self.actions_attributes)
         self.section_indices = {}
-        self.plays = self.get_plays_from_game(cur)
+        self.lineup_engine = lineup_engine
+        self.has_new_lineups = False
+        # Rows or a payload were already loaded in bulk (see
+        # StatsObject.add_games_in_bulk), which also owns the transaction.
+        in_bulk = rows is not None or payload is not None
+        if not in_bulk:
+            rows, stint_rows = self.get_rows_from_game(cur)
+        self.plays = None
+        if payload is not None:
+            # Built in a worker process (see build_game()), so the lineups
+            # and masks are already found.
+            self.plays = self.make_plays_from_payload(payload, columnar)
+        elif columnar:
+            # None if some lineups have to be found, which takes Plays.
+            self.plays = self.make_store_from_rows(rows, stint_rows)
+        if self.plays is None:
+            self.plays = self.make_plays_from_rows(cur, rows, stint_rows)
+            self.add_lineup_masks(self.plays)
+        self.stints = self.make_stints(self.plays)
+        self.on_court_intervals = None
+        # Games loaded in bulk are saved together by the StatsObject.
+        if not in_bulk:
+            if self.has_new_lineups and save_lineups:
+                self.add_lineups_to_db(cur)
+            conn.commit() # Commit inserts made into the lineup_stints table.
+        if columnar and not isinstance(self.plays, PlayStore):
+            self.plays = store_from_plays(self.plays, self.roster_order,
+                                          self.actions_attributes)
+        if isinstance(self.plays, PlayStore):
+            self.play_times = self.plays.time
+            self.play_masks = [self.plays.lineup_masks[lineup]
+                               for lineup in self.plays.lineup.tolist()]
+        else:
+            self.play_times = [p.time for p in self.plays]
+            self.play_masks = [p.lineup_mask for p in self.plays]
+        self.play_store = None
         self.lineups = {"home":self.get_lineups(home),
                         "away":self.get_lineups(away)}
-        conn.commit() # Commit inserts made into the lineup table.
-        cur.close()
+        if cur is not None:
+            cur.close()
+        
+    # [no args] -> [void]
+    def index_roster(self):
+        """Give every Player in the roster a fixed index for this Game."""
+        
+        self.roster_order = sorted(self.roster.itervalues(),
+                                   key=lambda P: P.p_id)
+        self.roster_index = {P: i for i, P in enumerate(self.roster_order)}
+        self.player_bits = {P: 1 << i for P, i in self.roster_index.iteritems()}
+        
+    # set of Players -> returns int
+    def get_mask(self, players):
+        """The bitmask of a set of this Game's Players."""
+        
+        mask = 0
+        for P in players:
+            mask |= self.player_bits[P]
+        return mask
+        
+    # list of Plays -> [void]
+    def add_lineup_masks(self, plays):
+        """Give each Play the bitmask of both of its lineups.
+        
+            Also record which Players appear in each section's lineups.
+        """
+        
+        masks = {} # {(frozenset, frozenset): int}, lineups repeat a lot
+        self.section_masks = {}
+        for p in plays:
+            key = (p.lineups["home"], p.lineups["away"])
+            if key not in masks:
+                masks[key] = (self.get_mask(key[0]) | self.get_mask(key[1]))
+            p.lineup_mask = masks[key]
+            self.section_masks[p.section] = (
+                self.section_masks.get(p.section, 0) | p.lineup_mask)
+        
+    # list of Plays or PlayStore -> returns {int: list of Stints}
+    def make_stints(self, plays):
+        """Split each section's Plays into Stints with the same lineups.
+        
+            The Plays must already have their lineup masks.
+        """
+        
+        stints = {}
+        stint = None
+        for i, (player, a_id, time, section, lineups, lineup_mask) in (
+                enumerate(self.play_values(plays))):
+            if (stint is None or section != stint.section or
+                lineup_mask != stint.lineup_mask):
+                stint = Stint(section, i, time, lineups, lineup_mask)
+                stints.setdefault(section, []).append(stint)
+            stint.add_Play(i, time, player, a_id)
+        return stints
+        
+    # list of Plays or PlayStore -> returns generator of tuples
+    def play_values(self, plays=None):
+        """(player, a_id, time, section, lineups, lineup_mask) of each Play.
+        
+            A PlayStore's columns are read without making Plays. plays are
+        this Game's by default.
+        """
+        
+        if plays is None:
+            plays = self.plays
+        if not isinstance(plays, PlayStore):
+            for p in plays:
+                yield (p.player, p.a_id, p.time, p.section, p.lineups,
+                       p.lineup_mask)
+            return
+        players = plays.players
+        lineup_table = plays.lineup_table
+        lineup_masks = plays.lineup_masks
+        for player, a_id, time, section, lineup in itertools.izip(
+                plays.player.tolist(), plays.a_id.tolist(),
+                plays.time.tolist(), plays.section.tolist(),
+                plays.lineup.tolist()):
+            yield (players[player], a_id, time, section,
+                   lineup_table[lineup], lineup_masks[lineup])
         
-    # cursor -> returns list of Plays with lineups
-    def get_plays_from_game(self, cur):
+    # int -> returns (Player, int)
+    def get_action(self, i):
+        """Who made the Play at index i, and its action id."""
+        
+        if isinstance(self.plays, PlayStore):
+            return (self.plays.players[self.plays.player[i]],
+                    int(self.plays.a_id[i]))
+        return self.plays[i].player, self.plays[i].a_id
+        
+    # [no args] -> returns list of Plays
+    def get_Plays(self):
+        """The Plays, made from the PlayStore if columnar (eg to print)."""
+        
+        if isinstance(self.plays, PlayStore):
+            return self.plays.make_Plays()
+        return self.plays
+        
+    # [no args] -> returns {int: (list of ints, list of ints, {Player: int})}
+    def get_on_court_intervals(self):
+        """When each Player was on the court, in each section.
+        
+            A section's Stints are its intervals, with their start and end
+        times, and each Player in it has an int with bit i set if they were
+        on the court during Stint i. Intervals of any lineup are then a few
+        bitwise operations away (see get_seconds_with_lineup()). They're made
+        from the Stints once and kept with the Game.
+        """
+        
+        if self.on_court_intervals is None:
+            self.on_court_intervals = {}
+            for section, stints in self.stints.iteritems():
+                bits = {}
+                for i, stint in enumerate(stints):
+                    for P in stint.lineups["home"] | stint.lineups["away"]:
+                        bits[P] = bits.get(P, 0) | (1 << i)
+                self.on_court_intervals[section] = (
+                    [stint.start_time for stint in stints],
+                    [stint.end_time for stint in stints], bits)
+        return self.on_court_intervals
+        
+    # set of Players, set of Players -> returns float or int
+    def get_seconds_with_lineup(self, on_court, not_on_court):
+        """Seconds with every on_court Player and no not_on_court Player on.
+        
+            The intervals with the lineup are the intersection of the on_court
+        Players' and the rest minus the not_on_court Players'. Runs of them
+        are spans, timed by the same rules as Timeline.get_seconds() (see
+        section_seconds()), so this is what a Question with these lineup
+        filters would find from this Game's Plays.
+        """
+        
+        seconds = 0
+        for section, (starts, ends, bits) in (
+                self.get_on_court_intervals().iteritems()):
+            on = (1 << len(starts)) - 1
+            for P in on_court:
+                on &= bits.get(P, 0)
+            if not on:
+                continue
+            for P in not_on_court:
+                on &= ~bits.get(P, 0)
+            # Bit i of changes is set where Stint i is the first of a run.
+            changes = (on ^ (on << 1)) & ((1 << len(starts)) - 1) | 1
+            firsts = []
+            while changes:
+                low = changes & -changes
+                firsts += [low.bit_length() - 1]
+                changes ^= low
+            types = [bool(on >> first & 1) for first in firsts]
+            span_starts = [starts[first] for first in firsts]
+            span_starts[0] = 1200 if section <= 2 else 300
+            span_ends = [ends[first - 1] for first in firsts[1:]] + [ends[-1]]
+            seconds += section_seconds(types, span_starts, span_ends)
+        return seconds
+        
+    # cursor -> returns (list of tuples, list of tuples)
+    def get_rows_from_game(self, cur):
+        """This game's play rows and stint rows (see make_plays_from_rows())."""
+        
+        cur.execute("""
+            SELECT play_id, player_id, action_id, time, section
+            FROM play_by_plays
+            WHERE game_id = %s ORDER BY play_id""",
+            (self.g_id,))
+        rows = cur.fetchall()
         cur.execute("""
-            SELECT pbp.play_id, pbp.player_id, pbp.action_id, pbp.time,
-                pbp.section, L.home_lineup, L.away_lineup 
-            FROM play_by_plays pbp LEFT JOIN lineups L 
-                ON pbp.play_id = L.play_id 
-            WHERE game_id = %s ORDER BY pbp.play_id""",
+            SELECT first_play_id, last_play_id, home_lineup, away_lineup
+            FROM lineup_stints
+            WHERE game_id = %s ORDER BY first_play_id""",
             (self.g_id,))
+        return rows, cur.fetchall()
+        
+    # cursor, list of tuples, list of tuples -> returns list of Plays
+    def make_plays_from_rows(self, cur, rows, stint_rows=None):
+        """Turn play_by_plays rows and lineup_stints rows into Plays.
+        
+            Each row is (play_id, player_id, action_id, time, section), and
+        each stint row is (first_play_id, last_play_id, home_lineup,
+        away_lineup), both ordered by play_id. Every Play from first_play_id
+        through last_play_id has that stint's lineups. Plays in no stint get
+        lineups from add_lineups_to_game().
+        """
+        
+        if stint_rows is None:
+            stint_rows = []
         plays = []
         lineup_not_found_in_table = False
         previous_section = 0
-        rows = cur.fetchall()
+        stint_i = 0
+        home_lineup, away_lineup = None, None
         for i in range(len(rows)):
             row = rows[i]
             play_id =    row[0]
@@ -79,18 +329,29 @@ class Game:
             a_id =       row[2]
             time =       row[3]
             section =    row[4]
-            home_array = row[5] # A postgres array of player IDs as the lineup
-            away_array = row[6]
+            # Move to the stint that ends at or after this Play.
+            while (stint_i < len(stint_rows) and
+                   stint_rows[stint_i][1] < play_id):
+                stint_i += 1
+                home_lineup, away_lineup = None, None
             # If there's no lineup for this Play, record that and call a
             # function to add all lineups as needed to the db and Plays.
-            if home_array is None or away_array is None:
+            if (stint_i == len(stint_rows) or
+                    stint_rows[stint_i][0] > play_id):
                 lineup_not_found_in_table = True
-                home_lineup, away_lineup = None, None
+                h_lineup, a_lineup = None, None
             else:
-                home_lineup = [self.roster[i] for i in home_array]
-                away_lineup = [self.roster[i] for i in away_array]
+                # The stint's lineups are made once and shared by its Plays.
+                if home_lineup is None:
+                    home_array = stint_rows[stint_i][2] # Player IDs
+                    away_array = stint_rows[stint_i][3]
+                    home_lineup = frozenset(self.roster[p_id]
+                                            for p_id in home_array)
+                    away_lineup = frozenset(self.roster[p_id]
+                                            for p_id in away_array)
+                h_lineup, a_lineup = home_lineup, away_lineup
             plays += [Play(play_id, player, a_id, self.actions_attributes,
-                           time, section, home_lineup, away_lineup)]
+                           time, section, h_lineup, a_lineup)]
             if section > previous_section:
                 self.section_indices[section] = i
             previous_section = section
@@ -105,6 +366,120 @@ class Game:
                 return self.add_lineups_to_game(cur, plays)
             return plays
             
+    # dict, bool -> returns list of Plays or PlayStore
+    def make_plays_from_payload(self, payload, columnar=False):
+        """Turn a payload made by get_payload() back into Plays.
+        
+            Each pair of lineups is made once and shared by its Plays, and
+        the Plays, sections and Players' bitmasks are the worker's, so
+        nothing is found again. Lineups the worker found are in its stint
+        rows, and are saved by the caller (see has_new_lineups). If
+        columnar, the rows go straight into a PlayStore instead.
+        """
+        
+        lineups = [(frozenset(self.roster[p_id] for p_id in home),
+                    frozenset(self.roster[p_id] for p_id in away))
+                   for home, away in payload["lineups"]]
+        masks = payload["masks"]
+        self.section_indices = payload["section_indices"]
+        self.section_masks = payload["section_masks"]
+        self.has_new_lineups = payload["stint_rows"] is not None
+        if columnar:
+            return PlayStore(self.roster_order, self.actions_attributes,
+                             payload["rows"],
+                             [row[5] for row in payload["rows"]],
+                             [{"home": home, "away": away}
+                              for home, away in lineups], masks)
+        plays = []
+        for play_id, p_id, a_id, time, section, pair in payload["rows"]:
+            play = Play(play_id, self.roster[p_id], a_id,
+                        self.actions_attributes, time, section,
+                        lineups[pair][0], lineups[pair][1])
+            play.lineup_mask = masks[pair]
+            plays += [play]
+        return plays
+        
+    # list of tuples, list of tuples -> returns PlayStore or None
+    def make_store_from_rows(self, rows, stint_rows):
+        """Turn play_by_plays rows and lineup_stints rows into a PlayStore.
+        
+            The rows are as in make_plays_from_rows(), but no Plays are made:
+        each row just gets the index of its stint's pair of lineups, and each
+        distinct pair is made once. If any row is in no stint, return None,
+        since finding lineups takes Plays.
+        """
+        
+        pairs = {} # {(frozenset, frozenset) of player IDs: int}
+        lineup_table = []
+        lineup_masks = []
+        lineup = []
+        pair = None
+        previous_section = 0
+        stint_i = 0
+        self.section_masks = {}
+        for i, row in enumerate(rows):
+            play_id = row[0]
+            section = row[4]
+            while (stint_i < len(stint_rows) and
+                   stint_rows[stint_i][1] < play_id):
+                stint_i += 1
+                pair = None
+            if (stint_i == len(stint_rows) or
+                    stint_rows[stint_i][0] > play_id):
+                return None
+            if pair is None:
+                key = (frozenset(stint_rows[stint_i][2]),
+                       frozenset(stint_rows[stint_i][3]))
+                if key not in pairs:
+                    pairs[key] = len(lineup_table)
+                    home = frozenset(self.roster[p_id] for p_id in key[0])
+                    away = frozenset(self.roster[p_id] for p_id in key[1])
+                    lineup_table += [{"home": home, "away": away}]
+                    lineup_masks += [self.get_mask(home) | self.get_mask(away)]
+                pair = pairs[key]
+            lineup += [pair]
+            self.section_masks[section] = (self.section_masks.get(section, 0) |
+                                           lineup_masks[pair])
+            if section > previous_section:
+                self.section_indices[section] = i
+            previous_section = section
+        if len(rows) == 0:
+            self.has_invalid_data = "No play data"
+        return PlayStore(self.roster_order, self.actions_attributes, rows,
+                         lineup, lineup_table, lineup_masks)
+        
+    # [no args] -> returns dict
+    def get_payload(self):
+        """This Game's Plays, lineups and masks as plain lists, to pickle.
+        
+            "rows" are the play rows, each with the index of its pair of
+        lineups in "lineups" appended. "lineups" holds each distinct pair
+        once as lists of player IDs, and "masks" their bitmasks, which are
+        the same in any Game with the same roster. "stint_rows" are the
+        lineup_stints rows to save if lineups were found (see
+        get_stint_rows()), and None otherwise. A payload is a fraction of the
+        size of the Game, and make_plays_from_payload() rebuilds it.
+        """
+        
+        pairs = {} # {(frozenset, frozenset): int}
+        lineups = []
+        masks = []
+        rows = []
+        for p in self.plays:
+            key = (p.lineups["home"], p.lineups["away"])
+            if key not in pairs:
+                pairs[key] = len(lineups)
+                lineups += [(sorted(P.p_id for P in key[0]),
+                             sorted(P.p_id for P in key[1]))]
+                masks += [p.lineup_mask]
+            rows += [(p.play_id, p.player.p_id, p.a_id, p.time, p.section,
+                      pairs[key])]
+        stint_rows = self.get_stint_rows() if self.has_new_lineups else None
+        return {"rows": rows, "lineups": lineups, "masks": masks,
+                "section_indices": self.section_indices,
+                "section_masks": self.section_masks,
+                "stint_rows": stint_rows}
+        
     # int -> returns int
     def get_other_team_id(self, school_id):
         """Get the other key in self.teams."""
@@ -121,6 +496,13 @@ class Game:
         # If the next section doesn't exist, just go to the end.
         end = self.section_indices.get(section+1, None) 
         return list_of_plays[begin:end]
+        
+    # [no args] -> returns int
+    def get_length(self):
+        """The length of the game in minutes."""
+        
+        # The first two sections are 40 minutes; each one after is 5
+        return 40 + (len(self.section_indices) - 2)*5
             
     """
     BEGIN LINEUP BUILDING METHODS
@@ -133,53 +515,157 @@ class Game:
     
     # cursor, list of Plays -> returns same list of Plays with lineups
     def add_lineups_to_game(self, cur, plays):
-        """Add lineups to each section and return them combined."""
+        """Add lineups to each section and return them combined.
+        
+            They're saved to the db once the Game has its Stints (see
+        add_lineups_to_db()).
+        """
         
+        if self.lineup_engine == "substitutions":
+            add_lineups = self.add_lineups_by_substitution
+        else:
+            add_lineups = self.add_lineups
         plays_with_lineups = []
         for section in sorted(self.section_indices):
-            plays_with_lineups += self.add_lineups(cur,
-                self.get_section(section, plays))
+            plays_with_lineups += add_lineups(self.get_section(section, plays))
+        self.has_new_lineups = True
         return plays_with_lineups
         
-    # slice of list of Plays -> returns same slice with lineups
-    def add_lineups(self, cur, plays_slice):
+    # slice of list of Plays, bool -> returns same slice with lineups
+    def add_lineups(self, plays_slice, sweep=True):
         """Add lineups to a slice of a list of Plays.
         
             Iterate through every Play. For each that doesn't have both
         lineups, get the 5 closest Players on each team who could be on
-        the court, and add them to that Play and the lineups table in the db.
+        the court, and add them to that Play.
+            The closest Players in each direction are found for every Play in
+        one pass each way (see sweep_nearest_players()). If sweep is False,
+        they're found by scanning from each Play instead, which takes time
+        quadratic in the length of the slice but gives the same lineups.
         """
         
-        for i in range(len(plays_slice)):
-            this_play = plays_slice[i]
-            this_player = this_play.player
-            if (this_play.lineups["home"] != set() and 
-                    this_play.lineups["away"] != set()):
-                continue # Skip those that already have lineups.
-                
-            if this_player.last == "TEAM":
-                num_teammates_needed = 5 # TEAM won't go in the lineup
-            else:
-                num_teammates_needed = 4 # This player will go in the lineup
-            team_id = this_player.s_id
-            oppnt_id = self.get_other_team_id(team_id) # opponent school id
-            
+        indices = [i for i in range(len(plays_slice))
+                   if not (plays_slice[i].lineups["home"] != set() and
+                           plays_slice[i].lineups["away"] != set())]
+        previous, next = None, None
+        if sweep:
+            previous = self.sweep_nearest_players("prev", indices,
+                                                  plays_slice)
+            next =     self.sweep_nearest_players("next", indices,
+                                                  plays_slice)
+        for i in indices:
+            lineups = self.nearest_lineups(i, plays_slice, previous, next)
+            plays_slice[i].lineups = {self.teams[team_id]: lineup
+                                      for team_id, lineup in lineups.iteritems()}
+        return plays_slice
+        
+    # int, slice of list of Plays, dict, dict
+    #                           -> returns {int: frozenset of Players}
+    def nearest_lineups(self, i, plays_slice, previous=None, next=None):
+        """Each team's lineup (by school id) at a Play, from the closest Players.
+        
+            previous and next are from sweep_nearest_players(). Without them,
+        the slice is scanned from the Play instead.
+        """
+        
+        this_play = plays_slice[i]
+        this_player = this_play.player
+        
+        if this_player.last == "TEAM":
+            num_teammates_needed = 5 # TEAM won't go in the lineup
+        else:
+            num_teammates_needed = 4 # This player will go in the lineup
+        team_id = this_player.s_id
+        oppnt_id = self.get_other_team_id(team_id) # opponent school id
+        
+        if previous is not None:
+            teammates = self.closest_n_players(num_teammates_needed,
+                previous[i][team_id], next[i][team_id])
+            opponents = self.closest_n_players(5,
+                previous[i][oppnt_id], next[i][oppnt_id])
+        else:
             teammates = self.closest_n_players_from_a_team(
                 num_teammates_needed, i, team_id, plays_slice)
             opponents = self.closest_n_players_from_a_team(
                 5,                    i, oppnt_id, plays_slice)
-                
-            # If the player is TEAM, the team lineup will already be full.
-            if this_player.last != "TEAM":
-                teammates.add(this_player)
-            teammates = frozenset(teammates)
-            opponents = frozenset(opponents)
             
-            lineups = {self.teams[team_id]: teammates,
-                       self.teams[oppnt_id]: opponents}
-            plays_slice[i].lineups = lineups
-            self.add_lineups_to_db(cur, this_play.play_id, lineups)
+        # If the player is TEAM, the team lineup will already be full.
+        if this_player.last != "TEAM":
+            teammates.add(this_player)
+        return {team_id: frozenset(teammates), oppnt_id: frozenset(opponents)}
+        
+    # slice of list of Plays -> returns same slice with lineups
+    def add_lineups_by_substitution(self, plays_slice):
+        """Add lineups to a slice of a list of Plays by following substitutions.
+        
+            Walk the slice once, keeping the Players on court for each team:
+        the starters (see get_starters()), then changed by every enter and
+        leave Play. Each Play without lineups gets the current ones, and
+        lineups already known are trusted as they are.
+            The nearest Players (see add_lineups()) are only used to repair a
+        team's lineup at a Play that isn't a substitution, if it doesn't have
+        5 Players or the Player making the Play isn't in it. So lineups only
+        change at substitutions and repairs, and runs of Plays share the same
+        frozensets, ready to be Stints.
+        """
+        
+        enter_id = self.get_rule_out_id("next")
+        leave_id = self.get_rule_out_id("prev")
+        indices = range(len(plays_slice))
+        previous = self.sweep_nearest_players("prev", indices, plays_slice)
+        next =     self.sweep_nearest_players("next", indices, plays_slice)
+        on_court = self.get_starters(plays_slice, enter_id)
+        lineups = {team_id: frozenset(players)
+                   for team_id, players in on_court.iteritems()}
+        for i in indices:
+            play = plays_slice[i]
+            player = play.player
+            if (play.lineups["home"] != set() and
+                    play.lineups["away"] != set()):
+                for team_id, team in self.teams.iteritems():
+                    lineups[team_id] = play.lineups[team]
+                    on_court[team_id] = set(play.lineups[team])
+                continue
+            
+            team_id = player.s_id
+            if play.a_id in (enter_id, leave_id):
+                if player.last != "TEAM":
+                    if play.a_id == enter_id:
+                        on_court[team_id].add(player)
+                    else:
+                        on_court[team_id].discard(player)
+                    lineups[team_id] = frozenset(on_court[team_id])
+            else:
+                repaired = None
+                for team_id in self.teams:
+                    if (len(on_court[team_id]) != 5 or
+                            (player.s_id == team_id and
+                             player.last != "TEAM" and
+                             player not in on_court[team_id])):
+                        if repaired is None:
+                            repaired = self.nearest_lineups(i, plays_slice,
+                                                            previous, next)
+                        lineups[team_id] = repaired[team_id]
+                        on_court[team_id] = set(repaired[team_id])
+            play.lineups = {team: lineups[team_id]
+                            for team_id, team in self.teams.iteritems()}
         return plays_slice
+        
+    # slice of list of Plays, int -> returns {int: set of Players}
+    def get_starters(self, plays_slice, enter_id):
+        """Each team's first 5 Players (by school id) to make a Play in the
+        slice, not counting those whose first Play is entering the game."""
+        
+        starters = {team_id: set() for team_id in self.teams}
+        seen = set()
+        for play in plays_slice:
+            player = play.player
+            if player.last == "TEAM" or player in seen:
+                continue
+            seen.add(player)
+            if play.a_id != enter_id and len(starters[player.s_id]) < 5:
+                starters[player.s_id].add(player)
+        return starters
     
     # int, int, int, slice of list of Plays -> returns set of Players
     def closest_n_players_from_a_team(self, n, index, id_of_team, plays_slice):
@@ -194,10 +680,20 @@ class Game:
                                            id_of_team, plays_slice)
         next =     self.get_next_or_prev_n("next", n, index,
                                            id_of_team, plays_slice)
+        return self.closest_n_players(n, previous, next)
+        
+    # int, list of (int, Player), list of (int, Player) -> returns set of Players
+    def closest_n_players(self, n, previous, next):
+        """The closest n unique Players among the previous and next ones.
+        
+            previous and next are lists of (distance from a Play, Player) in
+        order of distance, as from get_next_or_prev_n().
+        """
+        
         # Combine the lists and sort by the distance from the index (first
         # element). Return a set of the first n unique Players.
         closest_n_players = set()
-        for player_tuple in sorted(previous + next, key=itemgetter(0)):
+        for player_tuple in sorted(previous[:n] + next[:n], key=itemgetter(0)):
             if len(closest_n_players) == n:
                 break
             player = player_tuple[1]
@@ -221,15 +717,13 @@ class Game:
         
         if direction == "prev":
             # Players who leave before this play can be ruled out of the lineup.
-            action_id_that_rules_out = StatsObject.get_one_id_matching_type(
-                self.actions_attributes, "leave")
+            action_id_that_rules_out = self.get_rule_out_id("prev")
             # Start at the Play right before the index and go backwards, all
             # the way up to and including 0 (so end at -1).
             range_to_iterate = range(index - 1, -1, -1)
         elif direction == "next":
             # Similarly, Players who enter after can be ruled out.
-            action_id_that_rules_out = StatsObject.get_one_id_matching_type(
-                self.actions_attributes, "enter")
+            action_id_that_rules_out = self.get_rule_out_id("next")
             # Start at the Play right after the index and go to the end.
             range_to_iterate = range(index + 1, len(plays_slice))
             
@@ -258,17 +752,145 @@ class Game:
             distance_from_index += 1
         return n_to_return
         
-    # cursor, int, {string ("home"/"away"): frozenset of Players} -> [void]
-    def add_lineups_to_db(self, cur, play_id, lineups):
-        """Add a Play's lineups to the lineups db table."""
+    # string -> returns int
+    def get_rule_out_id(self, direction):
+        """The action that rules a Player out of lineups before ("prev") or
+        after ("next") it: leaving and entering the game, respectively."""
         
-        home_ids = [Player.p_id for Player in lineups["home"]]
-        away_ids = [Player.p_id for Player in lineups["away"]]
+        action_type = "leave" if direction == "prev" else "enter"
+        return self.catalog.first_id_of_type.get(action_type)
+            
+    # string, list of ints, slice of list of Plays
+    #              -> returns {int: {int: list of (int, Player)}}
+    def sweep_nearest_players(self, direction, indices, plays_slice):
+        """get_next_or_prev_n() for every index, in one pass over the slice.
         
-        cur.execute("""
-            INSERT INTO lineups (play_id, home_lineup, away_lineup)
-            VALUES (%s, %s, %s)""",
-            (play_id, home_ids, away_ids))
+            Return each index's closest 5 Players of each team (by school id)
+        in the direction given, exactly as get_next_or_prev_n() finds them.
+        Fewer are needed for a Play's own team, and those are the first ones.
+            The pass goes the other way (forward for "prev"), keeping each
+        team's Players in order of their most recent Play so far. Scanning
+        from a Play, the first Play seen by each Player is the only one that
+        matters: it either rules them out or makes them a candidate. So a
+        Play's candidates are just the front of that list. Their distance
+        counts the Plays the scan would have looked at before getting to
+        them, which are:
+            - every non-TEAM Play by the other team, from prefix counts,
+            - the first Play of each teammate nearer in the list, and
+            - the Plays by the Player making this Play, up to and including
+              one that rules them out.
+        """
+        
+        rules_out = self.get_rule_out_id(direction)
+        if direction == "prev":
+            order = range(len(plays_slice))
+        else:
+            order = range(len(plays_slice) - 1, -1, -1)
+        wanted = set(indices)
+        recent = {team_id: [] for team_id in self.teams} # [Player, a_id, step]
+        team_plays = {team_id: [] for team_id in self.teams} # prefix counts
+        num_team_plays = {team_id: 0 for team_id in self.teams}
+        player_steps = {}     # {Player: list of steps}
+        rule_out_steps = {}   # {Player: list of steps}
+        nearest = {}
+        for step, i in enumerate(order):
+            for team_id in self.teams:
+                team_plays[team_id] += [num_team_plays[team_id]]
+            play = plays_slice[i]
+            player = play.player
+            if i in wanted:
+                nearest[i] = {}
+                for team_id in self.teams:
+                    other_id = self.get_other_team_id(team_id)
+                    # The Player's own Plays only matter to their team.
+                    own_steps, own_rule_outs = [], []
+                    if player.s_id == team_id:
+                        own_steps = player_steps.get(player, [])
+                        own_rule_outs = rule_out_steps.get(player, [])
+                    nearest[i][team_id] = self.nearest_from_sweep(
+                        rules_out, step, player, recent[team_id],
+                        team_plays[other_id], own_steps, own_rule_outs)
+            if player.last == "TEAM":
+                continue
+            team = recent[player.s_id]
+            for j in range(len(team)):
+                if team[j][0] is player:
+                    del team[j]
+                    break
+            team.insert(0, (player, play.a_id, step))
+            num_team_plays[player.s_id] += 1
+            player_steps.setdefault(player, []).append(step)
+            if play.a_id == rules_out:
+                rule_out_steps.setdefault(player, []).append(step)
+        return nearest
+        
+    # int, int, Player, list of tuples, list of ints, list of ints,
+    #                     list of ints -> returns list of (int, Player)
+    def nearest_from_sweep(self, rules_out, step, player_making_action,
+                           recent, other_team_plays, own_steps, own_rule_outs):
+        """The closest 5 Players of one team to the Play at step of a sweep.
+        
+            See sweep_nearest_players(). other_team_plays[s] is how many
+        non-TEAM Plays the other team made before step s. own_steps and
+        own_rule_outs are the steps of the Plays so far by the Player making
+        this Play (and those that rule them out), if they're on this team.
+        """
+        
+        # The Plays by the Player making this Play are looked at until one
+        # rules them out (at first_counted).
+        first_counted = own_rule_outs[-1] if own_rule_outs else 0
+        
+        closest = []
+        teammates_seen = 0
+        for player, a_id, player_step in recent:
+            if player is player_making_action:
+                continue
+            if a_id != rules_out:
+                own_plays = len(own_steps) - bisect_left(
+                    own_steps, max(player_step + 1, first_counted))
+                distance = (1 + teammates_seen + own_plays +
+                            other_team_plays[step] -
+                            other_team_plays[player_step + 1])
+                closest += [(distance, player)]
+                if len(closest) == 5:
+                    break
+            teammates_seen += 1
+        return closest
+        
+    # cursor -> [void]
+    def add_lineups_to_db(self, cur):
+        """Replace this Game's rows in the lineup_stints table with its Stints.
+        
+            One row per Stint rather than per Play, so a game takes tens of
+        rows, all written in one statement (see save_stints()). Any old rows
+        are replaced, since the Stints may have been split or merged by the
+        lineups just found.
+        """
+        
+        save_stints(cur, [self])
+                
+    # [no args] -> returns list of tuples
+    def get_stint_rows(self):
+        """This Game's Stints as lineup_stints rows, in order.
+        
+            Each row is (game_id, section, first_play_id, last_play_id,
+        start_time, end_time, home_lineup, away_lineup), with the lineups as
+        sorted lists of player IDs.
+        """
+        
+        if isinstance(self.plays, PlayStore):
+            play_ids = self.plays.play_id.tolist()
+        else:
+            play_ids = [p.play_id for p in self.plays]
+        rows = []
+        for section in sorted(self.stints):
+            for stint in self.stints[section]:
+                rows += [(self.g_id, section, play_ids[stint.first],
+                          play_ids[stint.last], stint.start_time,
+                          stint.end_time,
+                          sorted(P.p_id for P in stint.lineups["home"]),
+                          sorted(P.p_id for P in stint.lineups["away"]))]
+        return rows
                     
     # [no args] -> returns set of frozenset of Players
     def both_lineups(self):
@@ -282,23 +904,208 @@ class Game:
     def get_lineups(self, school_id):
         set_of_lineups = set()
         team = self.teams[school_id]
-        for p in self.plays:
-            if not (self.actions_attributes[p.a_id]["type"] == "enter" or
-                    self.actions_attributes[p.a_id]["type"] == "leave"):
-                set_of_lineups.add(p.lineups[team])
+        type_of_id = self.catalog.type_of_id
+        for _, a_id, _, _, lineups, _ in self.play_values():
+            if type_of_id[a_id] not in ("enter", "leave"):
+                set_of_lineups.add(lineups[team])
         return set_of_lineups
         
-    # list of Questions -> [void]
-    def add_data_to_Questions(self, list_of_Questions):
-        for p in self.plays:
-            for q in list_of_Questions:
-                # If this Question requests stats from this Game, add the Play.
-                if self.g_id in q.games:
-                    q.add_data_as_applicable(p, self.g_id)
+    # [no args] -> PlayStore
+    def get_play_store(self):
+        """The Plays as arrays. Columnar Games already store them this way."""
+        
+        if isinstance(self.plays, PlayStore):
+            return self.plays
+        if self.play_store is None:
+            self.play_store = store_from_plays(self.plays, self.roster_order,
+                                               self.actions_attributes)
+        return self.play_store
+        
+    # {int (section): list of Questions}, bool -> [void]
+    def add_data_to_Questions(self, routes, vectorized=False):
+        """Add the Stints of each section to the Questions routed to it.
+        
+            routes is this Game's table from StatsObject.plan_Questions(), so
+        every Question in it asks about this Game, and sections no Question
+        can match aren't scanned at all. Each Question checks a lineup once
+        per Stint rather than once per Play. If vectorized, each Question
+        gets all of its sections at once as arrays instead (see
+        Question.add_data_from_arrays()).
+        """
+        
+        for questions in routes.itervalues():
+            for q in questions:
+                q.compile_lineup_masks(self)
+        if vectorized:
+            sections_of = {} # {Question: list of ints}, in routing order
+            order = []
+            for section in sorted(routes):
+                for q in routes[section]:
+                    if q not in sections_of:
+                        sections_of[q] = []
+                        order += [q]
+                    sections_of[q] += [section]
+            store = self.get_play_store()
+            for q in order:
+                q.add_data_from_arrays(self, store, sections_of[q])
+            return
+        for section in sorted(routes):
+            stints = self.stints.get(section, [])
+            for q in routes[section]:
+                q.add_data_from_stints(self, stints)
        
+    # [no args] -> dict
+    def __getstate__(self):
+        """Pickle without the StatsObject proxy, which can't be pickled."""
+        
+        state = self.__dict__.copy()
+        state["SO"] = None
+        return state
+        
     # [no args] -> string     
     def __repr__(self):
         string = str(self.g_id) + "\n"
-        for p in self.plays:
+        for p in self.get_Plays():
             string += str(p) + "\n"
-        return string
\ No newline at end of file
+        return string
+
+# (int, int, int, {int: Player}, dict, list of tuples, list of tuples,
+#                                  string, bool) -> returns (int, dict)
+def build_game(task):
+    """Build a Game in a worker process, and return it as a payload.
+    
+        task is (game id, home id, away id, roster, actions_attributes, play
+    rows, stint rows, lineup engine), as given to Game, and lineups_only. The
+    Game is made with no StatsObject or connection, finding any missing
+    lineups, and only the game id and its payload are sent back (see
+    Game.get_payload()), never a Game or Players. The parent makes the Game
+    from the payload and writes its stint rows to the db (see
+    StatsObject.add_games_in_bulk()). If lineups_only, the payload only has
+    the stint rows (eg for backfill_lineups.py, which makes no Games).
+    """
+    
+    (g_id, home_id, away_id, roster, actions, rows, stint_rows,
+     lineup_engine, lineups_only) = task
+    G = Game(None, None, g_id, home=home_id, away=away_id, roster=roster,
+             actions=actions, rows=rows, stint_rows=stint_rows,
+             lineup_engine=lineup_engine)
+    if lineups_only:
+        return g_id, {"stint_rows": G.get_stint_rows()
+                                    if G.has_new_lineups else None}
+    return g_id, G.get_payload()
+
+# cursor, list of Games -> [void]
+def save_stints(cur, games):
+    """Replace the lineup_stints rows of these Games with their Stints."""
+    
+    save_stint_rows(cur, {G.g_id: G.get_stint_rows() for G in games})
+
+# cursor, {int (game id): list of tuples} -> [void]
+def save_stint_rows(cur, stint_rows):
+    """Replace the lineup_stints rows of these games with the rows given.
+    
+        The rows are as made by Game.get_stint_rows(), so games can be saved
+    without a Game (eg from build_game() payloads). The old rows of every
+    game are deleted with one statement, and the new ones written with one
+    multi-row INSERT per STINT_ROWS_PER_INSERT rows, instead of a round-trip
+    per row. The caller commits.
+        Another process may be saving the same games (eg the site and
+    backfill_lineups.py). Each game's transaction-level advisory lock is
+    taken first, in order of game id so two writers can't deadlock, so the
+    second waits for the first to commit and then replaces its rows, rather
+    than failing on the UNIQUE first_play_id when it inserts.
+    """
+    
+    if not stint_rows:
+        return
+    g_ids = sorted(stint_rows)
+    cur.execute("""
+        SELECT pg_advisory_xact_lock(g_id)
+        FROM (SELECT unnest(%s) AS g_id ORDER BY 1) AS ids""",
+        (g_ids,))
+    cur.execute("DELETE FROM lineup_stints WHERE game_id IN %s",
+                (tuple(g_ids),))
+    rows = [row for g_id in g_ids for row in stint_rows[g_id]]
+    for i in range(0, len(rows), STINT_ROWS_PER_INSERT):
+        values = ",".join(
+            cur.mogrify("(%s, %s, %s, %s, %s, %s, %s::integer[], "
+                        "%s::integer[])", row)
+            for row in rows[i:i + STINT_ROWS_PER_INSERT])
+        cur.execute("""
+            INSERT INTO lineup_stints (game_id, section, first_play_id,
+                last_play_id, start_time, end_time, home_lineup, away_lineup)
+            VALUES """ + values)
+
+# Just for debugging: find the lineups of every section of a school's games
+# (as if none were in the db) by scanning from each Play and with sweeps, and
+# check that they're identical. Both are timed on the longest games, which
+# are the ones with the most overtimes.
+# int, int -> [void]
+def compare_lineup_inference(school_id=554, longest=5):
+    import time
+    SO = StatsObject.StatsObject()
+    SO.add_games_from_school(school_id, bulk=True)
+    games = sorted(SO.dict_of_Games.itervalues(), reverse=True,
+                   key=lambda G: (len(G.section_indices), len(G.plays)))
+    num_sections = 0
+    mismatches = 0
+    seconds = {False: 0, True: 0}
+    for n, G in enumerate(games):
+        for section in sorted(G.section_indices):
+            lineups = {}
+            for sweep in (False, True):
+                plays = [Play(p.play_id, p.player, p.a_id,
+                              G.actions_attributes, p.time, p.section)
+                         for p in G.get_section(section, G.plays)]
+                start = time.time()
+                G.add_lineups(plays, sweep)
+                if n < longest:
+                    seconds[sweep] += time.time() - start
+                lineups[sweep] = [p.lineups for p in plays]
+            num_sections += 1
+            if lineups[False] != lineups[True]:
+                mismatches += 1
+                print "Mismatch in game {g}, section {s}".format(
+                    g=G.g_id, s=section)
+    print "{m} of {n} sections differ in {g} games".format(
+        m=mismatches, n=num_sections, g=len(games))
+    print "{l} longest games: scanning {a:.3f}s, sweeps {b:.3f}s".format(
+        l=min(longest, len(games)), a=seconds[False], b=seconds[True])
+
+# Also for debugging: find the lineups of every section of a school's games
+# with both engines (as if none were in the db), and report how many plays
+# they agree on, how long each took and how many stints each made.
+# int -> [void]
+def compare_lineup_engines(school_id=554):
+    import time
+    SO = StatsObject.StatsObject()
+    SO.add_games_from_school(school_id, bulk=True)
+    num_plays = 0
+    agreeing = 0
+    seconds = {"nearest": 0, "substitutions": 0}
+    num_stints = {"nearest": 0, "substitutions": 0}
+    for G in SO.dict_of_Games.itervalues():
+        for section in sorted(G.section_indices):
+            lineups = {}
+            for engine in seconds:
+                plays = [Play(p.play_id, p.player, p.a_id,
+                              G.actions_attributes, p.time, p.section)
+                         for p in G.get_section(section, G.plays)]
+                start = time.time()
+                if engine == "substitutions":
+                    G.add_lineups_by_substitution(plays)
+                else:
+                    G.add_lineups(plays)
+                seconds[engine] += time.time() - start
+                lineups[engine] = [p.lineups for p in plays]
+                num_stints[engine] += sum(1 for i in range(len(plays))
+                    if i == 0 or lineups[engine][i] != lineups[engine][i-1])
+            num_plays += len(lineups["nearest"])
+            agreeing += sum(1 for a, b in zip(lineups["nearest"],
+                                              lineups["substitutions"])
+                            if a == b)
+    print "{p:.1f}% of {n} plays have the same lineups".format(
+        p=100 * agreeing / max(num_plays, 1), n=num_plays)
+    for engine in sorted(seconds):
+        print "{e}: {s:.3f}s, {t} stints".format(
+            e=engine, s=seconds[engine], t=num_stints[engine])
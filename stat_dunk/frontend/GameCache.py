@@ -0,0 +1,208 @@
+from __future__ import division
+import threading
+import time
+from collections import OrderedDict
+
+class GameCache:
+    """A process-wide store of loaded Games, rosters and actions.
+
+        StatsObjects given a GameCache take everything they can from it and
+    put everything they load into it, so a school queried a second time never
+    touches the database. Games are evicted least recently used first once the
+    plays held by all cached Games pass max_plays (Plays are the bulk of a
+    Game's memory, so this bounds the cache's memory).
+        Plays and lineups are written by other processes (the data_gathering
+    scripts and backfill_lineups.py), so the cache can't be told when they
+    change. Instead each Game is kept with its version, a summary of its rows
+    in the db (see StatsObject.get_game_versions()), and once recheck_after
+    seconds have passed since it was last checked it isn't given out until
+    its version is checked again (see games_to_check() and check_games()).
+    Games whose rows changed are dropped. Rosters and schools' game lists are
+    simply loaded again once they're recheck_after seconds old.
+        Writers in this process can still call invalidate_game() or
+    invalidate_school() to drop stale data right away.
+
+        Instance attributes:
+    max_plays: int. The most Plays held by all cached Games together.
+    num_plays: int. The Plays currently held by all cached Games.
+    games: OrderedDict {int (game id): Game}, least recently used first.
+    recheck_after: float. Seconds before cached data is checked or reloaded.
+    versions: {int (game id): (tuple, float)}. Each cached Game's version and
+        when it was last checked.
+    rosters: {int (school id): ({int (player id): Player}, float (when it
+        was loaded))}.
+    school_games: {int (school id): (list of (game id, home id, away id),
+        float (when it was loaded))}.
+    actions_attributes: {int (action id): {see StatsObject}}, or None.
+    hits, misses: int. Counts of Game lookups, for tuning max_plays.
+    """
+
+    # int, float -> [void]
+    def __init__(self, max_plays=500000, recheck_after=60):
+        self.max_plays = max_plays
+        self.num_plays = 0
+        self.games = OrderedDict()
+        self.recheck_after = recheck_after
+        self.versions = {}
+        self.rosters = {}
+        self.school_games = {}
+        self.actions_attributes = None
+        self.hits = 0
+        self.misses = 0
+        # Django may serve requests from several threads.
+        self.lock = threading.RLock()
+
+    # int -> Game or None
+    def get_game(self, g_id):
+        """Return a cached Game and mark it as the most recently used.
+
+            A Game due to be checked (see games_to_check()) isn't returned.
+        """
+
+        with self.lock:
+            G = self.games.get(g_id)
+            if G is None or self.is_due(self.versions[g_id][1]):
+                self.misses += 1
+                return None
+            del self.games[g_id]
+            self.games[g_id] = G
+            self.hits += 1
+            return G
+
+    # Game, tuple -> [void]
+    def put_game(self, G, version):
+        """Cache a Game, evicting the least recently used ones as needed.
+
+            version must have been read before the Game's rows were, so a
+        write made while it was loading makes it stale rather than missed.
+        """
+
+        with self.lock:
+            self.remove_game(G.g_id)
+            self.games[G.g_id] = G
+            self.versions[G.g_id] = (version, time.time())
+            self.num_plays += len(G.plays)
+            # Always keep the newest Game, even if it alone is too big.
+            while self.num_plays > self.max_plays and len(self.games) > 1:
+                self.remove_game(next(iter(self.games)))
+
+    # int -> [void]
+    def remove_game(self, g_id):
+        with self.lock:
+            G = self.games.pop(g_id, None)
+            if G is not None:
+                self.num_plays -= len(G.plays)
+                del self.versions[g_id]
+
+    # float -> returns bool
+    def is_due(self, checked_at):
+        """Was something checked or loaded more than recheck_after ago?"""
+
+        return time.time() - checked_at > self.recheck_after
+
+    # iterable of ints -> returns list of ints
+    def games_to_check(self, g_ids):
+        """The cached Games of these that are due to be checked."""
+
+        with self.lock:
+            return [g_id for g_id in g_ids if g_id in self.versions and
+                    self.is_due(self.versions[g_id][1])]
+
+    # iterable of ints, {int (game id): tuple} -> [void]
+    def check_games(self, g_ids, versions):
+        """Drop the Games whose version changed, and mark the rest checked.
+
+            versions are the current versions of the games in g_ids. Games
+        missing from it were deleted.
+        """
+
+        with self.lock:
+            for g_id in g_ids:
+                if g_id not in self.versions:
+                    continue
+                if versions.get(g_id) != self.versions[g_id][0]:
+                    self.remove_game(g_id)
+                else:
+                    self.versions[g_id] = (versions[g_id], time.time())
+
+    # int -> {int: Player} or None
+    def get_roster(self, school_id):
+        """A school's cached roster, or None if it's due to be reloaded."""
+
+        with self.lock:
+            roster, loaded_at = self.rosters.get(school_id, (None, 0))
+            if roster is None or self.is_due(loaded_at):
+                return None
+            return roster
+
+    # int, {int: Player} -> returns {int: Player}
+    def put_roster(self, school_id, roster):
+        """Cache a school's roster, and return the roster to use.
+
+            Cached Games share Player objects with the roster they were made
+        with, so a reloaded roster keeps the cached Player of every player
+        already in it.
+        """
+
+        with self.lock:
+            old_roster = self.rosters.get(school_id, ({}, 0))[0]
+            roster = {p_id: old_roster.get(p_id, P)
+                      for p_id, P in roster.iteritems()}
+            self.rosters[school_id] = (roster, time.time())
+            return roster
+
+    # int -> list of tuples or None
+    def get_school_games(self, school_id):
+        """A school's cached game rows, or None if they're due to reload."""
+
+        with self.lock:
+            game_rows, loaded_at = self.school_games.get(school_id, (None, 0))
+            if game_rows is None or self.is_due(loaded_at):
+                return None
+            return game_rows
+
+    # int, list of tuples -> [void]
+    def put_school_games(self, school_id, game_rows):
+        with self.lock:
+            self.school_games[school_id] = (list(game_rows), time.time())
+
+    """
+    BEGIN INVALIDATION METHODS
+        Call these after writing to play_by_plays, lineup_stints, games or
+    players.
+    """
+
+    # int -> [void]
+    def invalidate_game(self, g_id):
+        """Drop a Game whose plays or lineups changed."""
+
+        self.remove_game(g_id)
+
+    # int -> [void]
+    def invalidate_school(self, school_id):
+        """Drop a school's roster, game list and every Game it played in.
+
+            Cached Games share Player objects with the cached roster, so they
+        can't outlive it.
+        """
+
+        with self.lock:
+            self.rosters.pop(school_id, None)
+            self.school_games.pop(school_id, None)
+            for g_id, G in self.games.items():
+                if school_id in G.teams:
+                    self.remove_game(g_id)
+
+    # [no args] -> [void]
+    def clear(self):
+        with self.lock:
+            self.games.clear()
+            self.versions.clear()
+            self.num_plays = 0
+            self.rosters.clear()
+            self.school_games.clear()
+            self.actions_attributes = None
+
+    """
+    END INVALIDATION METHODS
+    """
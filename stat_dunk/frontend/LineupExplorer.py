@@ -0,0 +1,200 @@
+from __future__ import division
+import itertools
+from collections import defaultdict
+from ActionCatalog import get_catalog
+from MulticondQuestion import team_ratings
+
+class LineupExplorer:
+    """Totals of every combination of a school's Players that shared the court.
+
+        Answering a stat for each combination with Questions would mean a
+    scan of every game per combination. Here each Stint of the school's games
+    is visited once: every combination (of each size asked for) of the
+    school's lineup in it gets the Stint's counts, in a dict keyed by the
+    combination. Combinations never on the court together are never made, so
+    there are only as many as were actually used (see
+    StatsObject.get_combinations_size_n_from_school_lineups()). Minutes come
+    from the Games' on-court intervals (see Game.get_seconds_with_lineup()).
+        The totals of a combination are what a Question with it as on_court
+    finds: "team" is a Question's actions_totals with who_made_action as the
+    school's Players, and "opponent" with the other team's.
+
+        Instance attributes:
+    SO: StatsObject. Its Games are the ones explored.
+    school_id: int.
+    sizes: tuple of ints. The sizes of combinations totalled.
+    games: set of ints (game IDs). The school's games explored.
+    catalog: ActionCatalog of the StatsObject's actions.
+    combinations: {int (size): {frozenset of Players: {"team": {int (action
+        ID): int}, "opponent": {int (action ID): int}, "games": set of ints
+        (game IDs), "seconds": float or int}}}. Filled by explore().
+    """
+
+    # StatsObject, int, iterable of ints, set of ints (game IDs) -> [void]
+    def __init__(self, SO, school_id, sizes=(5,), games=None):
+        self.SO = SO
+        self.school_id = school_id
+        self.sizes = tuple(sizes)
+        SO.load_pending_games()
+        self.games = {g_id for g_id, G in SO.dict_of_Games.iteritems()
+                      if school_id in G.teams and
+                      (games is None or g_id in games)}
+        self.catalog = get_catalog(SO.actions_attributes)
+        self.combinations = {size: {} for size in self.sizes}
+
+    # [no args] -> LineupExplorer
+    def explore(self):
+        """Total every combination in one pass over the games' Stints."""
+
+        self.combinations = {size: {} for size in self.sizes}
+        for g_id in sorted(self.games):
+            G = self.SO.dict_of_Games[g_id]
+            team = G.teams[self.school_id]
+            in_game = set() # Combinations on the court in this game.
+            for stints in G.stints.itervalues():
+                for stint in stints:
+                    team_counts = defaultdict(int)
+                    opponent_counts = defaultdict(int)
+                    for (player, a_id), count in stint.counts.iteritems():
+                        if player.s_id == self.school_id:
+                            team_counts[a_id] += count
+                        else:
+                            opponent_counts[a_id] += count
+                    for size in self.sizes:
+                        combinations = self.combinations[size]
+                        for combo in itertools.combinations(
+                                stint.lineups[team], size):
+                            combo = frozenset(combo)
+                            try:
+                                totals = combinations[combo]
+                            except KeyError:
+                                totals = combinations[combo] = {
+                                    "team": defaultdict(int),
+                                    "opponent": defaultdict(int),
+                                    "games": set(), "seconds": 0}
+                            for a_id, count in team_counts.iteritems():
+                                totals["team"][a_id] += count
+                            for a_id, count in opponent_counts.iteritems():
+                                totals["opponent"][a_id] += count
+                            in_game.add(combo)
+            for combo in in_game:
+                totals = self.combinations[len(combo)][combo]
+                totals["games"].add(g_id)
+                totals["seconds"] += G.get_seconds_with_lineup(combo, ())
+        return self
+
+    # dict (see combinations), list of strings, bool -> returns list
+    def get_stats(self, totals, stats, per_minute=False):
+        """The stats asked for of one combination's totals.
+
+            A stat is an action type (see ActionCatalog), "points",
+        "plus_minus", "minutes", "games", or "possessions", "ortg" or "drtg"
+        (the team's, see MulticondQuestion.team_ratings()). Action types and
+        "points" prefixed with "opp_" are the opponent's. If per_minute,
+        everything but "minutes", "games" and the ratings is divided by the
+        minutes, and is None if there are none. The possessions and ratings
+        are None if the formulas can't be worked out (eg no rebounds).
+        """
+
+        type_totals = {}
+        ratings = None
+        minutes = totals["seconds"] / 60
+        values = []
+        for stat in stats:
+            side = "team"
+            name = stat
+            if stat.startswith("opp_"):
+                side = "opponent"
+                name = stat[len("opp_"):]
+            if stat == "minutes":
+                values += [minutes]
+                continue
+            if stat == "games":
+                values += [len(totals["games"])]
+                continue
+            if stat in ("possessions", "ortg", "drtg"):
+                if ratings is None:
+                    try:
+                        ratings = team_ratings(self.catalog, totals["team"],
+                                               totals["opponent"])
+                    except ZeroDivisionError:
+                        ratings = {"possessions": None, "ortg": None,
+                                   "drtg": None}
+                value = ratings[stat]
+                if stat == "possessions" and per_minute and value is not None:
+                    value = value / minutes if minutes else None
+                values += [value]
+                continue
+            if stat == "plus_minus":
+                value = (self.catalog.total_points(totals["team"]) -
+                         self.catalog.total_points(totals["opponent"]))
+            elif name == "points":
+                value = self.catalog.total_points(totals[side])
+            else:
+                if side not in type_totals:
+                    type_totals[side] = self.catalog.type_totals(totals[side])
+                value = type_totals[side][name]
+            if per_minute:
+                value = value / minutes if minutes else None
+            values += [value]
+        return values
+
+    # int, list of strings, int or float, bool -> returns {frozenset: list}
+    def get_results(self, size, stats, min_minutes=0, per_minute=False):
+        """The stats of every combination of a size with min_minutes or more."""
+
+        return {combo: self.get_stats(totals, stats, per_minute)
+                for combo, totals in self.combinations[size].iteritems()
+                if totals["seconds"] / 60 >= min_minutes}
+
+    # int, string, int, int or float, bool, bool
+    #                           -> returns list of (frozenset of Players, value)
+    def top(self, size, stat, k=10, min_minutes=0, per_minute=False,
+            lowest=False):
+        """The k combinations of a size with the highest (or lowest) stat.
+
+            Only combinations with min_minutes or more are ranked, and ones
+        with no value (see get_stats()) are left out. Ties are broken by
+        minutes, most first.
+        """
+
+        ranked = []
+        for combo, totals in self.combinations[size].iteritems():
+            if totals["seconds"] / 60 < min_minutes:
+                continue
+            value = self.get_stats(totals, [stat], per_minute)[0]
+            if value is not None:
+                ranked += [(value if not lowest else -value,
+                            totals["seconds"], combo, value)]
+        ranked.sort(key=lambda r: r[:2], reverse=True)
+        return [(combo, value) for _, _, combo, value in ranked[:k]]
+
+# Just for debugging: time a season's 5-man and 2-man breakdown of a school,
+# and check the totals of its most played combinations against Questions.
+# int, int -> [void]
+def time_season_breakdown(school_id=554, checked=10):
+    import time
+    from StatsObject import StatsObject
+    from Question import Question
+    SO = StatsObject()
+    SO.add_games_from_school(school_id, bulk=True)
+    start = time.time()
+    explorer = LineupExplorer(SO, school_id, sizes=(5, 2)).explore()
+    print "{f} 5-man, {t} 2-man combinations in {s:.3f}s".format(
+        f=len(explorer.combinations[5]), t=len(explorer.combinations[2]),
+        s=time.time() - start)
+    roster = SO.rosters[school_id].values()
+    mismatches = 0
+    for size in (5, 2):
+        for combo, minutes in explorer.top(size, "minutes", k=checked):
+            Q = Question(games=explorer.games, on_court=combo,
+                         who_made_action=roster)
+            SO.answer_Questions([Q])
+            totals = explorer.combinations[size][combo]
+            if (dict(Q.actions_totals) != dict(totals["team"]) or
+                Q.timelines.get_seconds() / 60 != minutes or
+                Q.games_played_in != totals["games"]):
+                mismatches += 1
+                print "Mismatch:", sorted(P.p_id for P in combo)
+    print "{m} of {n} checked combinations differ".format(
+        m=mismatches, n=2 * checked)
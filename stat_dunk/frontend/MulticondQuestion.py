@@ -1,7 +1,6 @@
 from __future__ import division
 from Player import Player
 from Question import Question
-from StatsObject import StatsObject
 from collections import defaultdict
 
 """
@@ -32,6 +31,9 @@ class AST_rate_Q(Question):
     FGM_ids: set of ints (action IDs). Field goals made.
     """
 
+    # Plays by players outside who_made_action count too (see Question).
+    filters_by_who_made_action = False
+
     # OVERRIDE
     # set of ints (game ids), set of Players or ints (player ids),
     #                                      same as prev, same as prev -> [void]
@@ -60,10 +62,8 @@ class AST_rate_Q(Question):
             self, self.requested_players, roster)
     
     # OVERRIDE
-    # Play -> returns bool
-    def play_is_requested(self, play):
-        player = play.player
-        a_id =   play.a_id
+    # Player, int -> returns bool
+    def action_is_requested(self, player, a_id):
         is_req_player = player in self.requested_players and a_id == self.AST_id
         is_teammate = (player not in self.requested_players and
                        player.s_id == self.player_school and
@@ -106,6 +106,9 @@ class REB_rate_Q(Question):
     team_rebounds: int. Number of [type] rebounds made by the team.
     opponent_rebounds: Number of opponent team's [other type] rebounds.
     """
+
+    # Plays by players outside who_made_action count too (see Question).
+    filters_by_who_made_action = False
     
     # OVERRIDE
     # set of ints (game ids), set of Players or ints (player ids),
@@ -118,20 +121,33 @@ class REB_rate_Q(Question):
         self.requested_players = requested_players if requested_players else set()
         self.rebound_type = rebound_type
         self.other_reb_type = "DREB" if rebound_type == "OREB" else "OREB"
-        
+
+    # OVERRIDE
+    # [no args] -> [void]
+    def clear_totals(self):
+        Question.clear_totals(self)
         self.player_rebounds = 0
         self.team_rebounds = 0
         self.opponent_rebounds = 0
 
+    # OVERRIDE
+    # REB_rate_Q -> returns REB_rate_Q
+    def merge(self, partial):
+        Question.merge(self, partial)
+        self.player_rebounds += partial.player_rebounds
+        self.team_rebounds += partial.team_rebounds
+        self.opponent_rebounds += partial.opponent_rebounds
+        return self
+
     # OVERRIDE
     # StatsObject -> [void]
     def get_attrs_from_SO(self, SO):
     
         Question.get_attrs_from_SO(self, SO)
-        self.REB_type_id = StatsObject.get_one_id_matching_type(
-            self.actions_attributes, self.rebound_type)
-        self.REB_other_type_id = StatsObject.get_one_id_matching_type(
-            self.actions_attributes, self.other_reb_type)
+        self.REB_type_id = self.catalog.first_id_of_type.get(
+            self.rebound_type)
+        self.REB_other_type_id = self.catalog.first_id_of_type.get(
+            self.other_reb_type)
         self.player_school = next(iter(self.requested_players)).s_id
     
     # OVERRIDE
@@ -143,36 +159,28 @@ class REB_rate_Q(Question):
             self, self.requested_players, roster)        
     
     # OVERRIDE
-    # Play, int -> [void]
-    def add_data_as_applicable(self, play, game_id):
+    # Player, int, int -> [void]
+    def add_action_data(self, player, a_id, count=1):
         """Increment each total as according to the requested attributes.
         
-            Verifying that this is a correct Play and adding information is
+            Verifying that this is a requested action and adding information is
         generally separated, but because adding information is done differently
-        depending on which type of Play this is, verification and addition is
+        depending on which type of action this is, verification and addition is
         done most simply in one method.
         """
         
-        lineup_is_correct_ans = self.lineup_is_correct(play.both_lineups())
-        if lineup_is_correct_ans:
-            self.games_played_in.add(game_id)
-            player = play.player
-            a_id =   play.a_id
-            # Requested player makes the requested rebound type:
-            if (player in self.requested_players and
-                    a_id == self.REB_type_id):
-                self.player_rebounds += 1
-            # Requested players' team makes the requested rebound type:
-            if (player.s_id == self.player_school and
-                    a_id == self.REB_type_id):
-                self.team_rebounds += 1
-            # Opponent's team makes the other rebound type:
-            elif (player.s_id != self.player_school and
-                    a_id == self.REB_other_type_id):
-                self.opponent_rebounds += 1
-                    
-        self.update_timeline(play.time, play.section,
-                             lineup_is_correct_ans, game_id)
+        # Requested player makes the requested rebound type:
+        if (player in self.requested_players and
+                a_id == self.REB_type_id):
+            self.player_rebounds += count
+        # Requested players' team makes the requested rebound type:
+        if (player.s_id == self.player_school and
+                a_id == self.REB_type_id):
+            self.team_rebounds += count
+        # Opponent's team makes the other rebound type:
+        elif (player.s_id != self.player_school and
+                a_id == self.REB_other_type_id):
+            self.opponent_rebounds += count
     
     # OVERRIDE
     # [no args] -> returns list of basic info, and a float
@@ -198,6 +206,9 @@ class offensive_rtg_Q(Question):
     opponent_DREB: int. Number of defensive rebounds made by the oppt. team.
     DREB_id: int (action ID).
     """
+
+    # Plays by players outside who_made_action count too (see Question).
+    filters_by_who_made_action = False
     
     # OVERRIDE
     # set of ints (game ids), set of Players or ints (player ids),
@@ -208,10 +219,24 @@ class offensive_rtg_Q(Question):
         Question.__init__(self, games=games, on_court=on_court,
                           not_on_court=not_on_court)
         self.requested_players = requested_players if requested_players else set()
+
+    # OVERRIDE
+    # [no args] -> [void]
+    def clear_totals(self):
+        Question.clear_totals(self)
         # In addition to action_totals which is for the requested players:
         self.team_actions_totals = defaultdict(int) # All actions default to 0
         self.opponent_DREB = 0
 
+    # OVERRIDE
+    # offensive_rtg_Q -> returns offensive_rtg_Q
+    def merge(self, partial):
+        Question.merge(self, partial)
+        for a_id, total in partial.team_actions_totals.iteritems():
+            self.team_actions_totals[a_id] += total
+        self.opponent_DREB += partial.opponent_DREB
+        return self
+
     # OVERRIDE
     # StatsObject -> [void]
     def get_attrs_from_SO(self, SO):
@@ -229,26 +254,18 @@ class offensive_rtg_Q(Question):
             self, self.requested_players, roster)
 
     # OVERRIDE
-    # Play, int -> [void]
-    def add_data_as_applicable(self, play, game_id):
-        
-        lineup_is_correct_ans = self.lineup_is_correct(play.both_lineups())
-        if lineup_is_correct_ans:
-            self.games_played_in.add(game_id)
-            player = play.player
-            a_id =   play.a_id
-            # Record all requested player actions actions:
-            if player in self.requested_players:
-                self.actions_totals[a_id] += 1
-            # Record all team actions:
-            if player.s_id == self.player_school:
-                self.team_actions_totals[a_id] += 1
-            # Opponent team makes a defensive rebound:
-            elif a_id == self.DREB_id:
-                self.opponent_DREB += 1
-        
-        self.update_timeline(play.time, play.section,
-                             lineup_is_correct_ans, game_id)
+    # Player, int, int -> [void]
+    def add_action_data(self, player, a_id, count=1):
+        
+        # Record all requested player actions actions:
+        if player in self.requested_players:
+            self.actions_totals[a_id] += count
+        # Record all team actions:
+        if player.s_id == self.player_school:
+            self.team_actions_totals[a_id] += count
+        # Opponent team makes a defensive rebound:
+        elif a_id == self.DREB_id:
+            self.opponent_DREB += count
     
     # OVERRIDE
     # [no args] -> returns [basic info, float]
@@ -258,25 +275,28 @@ class offensive_rtg_Q(Question):
         # Formula from http://www.basketball-reference.com/about/ratings.html
         # Tweaked slightly to replace 0.4 with 0.475
         MP = self.get_minutes_played()
-        FGM = self.calculate_totals("FGM", self.actions_totals)
-        FGA = self.calculate_totals("FGA", self.actions_totals)
-        FGM_3 = self.calculate_totals("made_3FG", self.actions_totals)
-        FTM = self.calculate_totals("FTM", self.actions_totals)
-        FTA = self.calculate_totals("FTA", self.actions_totals)
-        TOV = self.calculate_totals("TOV", self.actions_totals)
-        OREB = self.calculate_totals("OREB", self.actions_totals)
-        AST = self.calculate_totals("AST", self.actions_totals)
+        # Every type total of each dict comes from one matrix product.
+        player = self.catalog.type_totals(self.actions_totals)
+        team = self.catalog.type_totals(self.team_actions_totals)
+        FGM = player["FGM"]
+        FGA = player["FGA"]
+        FGM_3 = player["made_3FG"]
+        FTM = player["FTM"]
+        FTA = player["FTA"]
+        TOV = player["TOV"]
+        OREB = player["OREB"]
+        AST = player["AST"]
         PTS = self.calculate_points(self.actions_totals)
         
         team_MP = self.SO.length_of_games(self.games_played_in)
-        team_FGM = self.calculate_totals("FGM", self.team_actions_totals)
-        team_FGA = self.calculate_totals("FGA", self.team_actions_totals)
-        team_FGM_3 = self.calculate_totals("made_3FG", self.team_actions_totals)
-        team_FTM = self.calculate_totals("FTM", self.team_actions_totals)
-        team_FTA = self.calculate_totals("FTA", self.team_actions_totals)
-        team_TOV = self.calculate_totals("TOV", self.team_actions_totals)
-        team_AST = self.calculate_totals("AST", self.team_actions_totals)
-        team_OREB = self.calculate_totals("OREB", self.team_actions_totals)
+        team_FGM = team["FGM"]
+        team_FGA = team["FGA"]
+        team_FGM_3 = team["made_3FG"]
+        team_FTM = team["FTM"]
+        team_FTA = team["FTA"]
+        team_TOV = team["TOV"]
+        team_AST = team["AST"]
+        team_OREB = team["OREB"]
         team_PTS = self.calculate_points(self.team_actions_totals)
         
         opp_DREB = self.opponent_DREB
@@ -355,6 +375,9 @@ class defensive_rtg_Q(Question):
         the whole players' team.
     opponent_actions_totals: same as above. Record actions by the oppt. team.
     """
+
+    # Plays by players outside who_made_action count too (see Question).
+    filters_by_who_made_action = False
     
     # OVERRIDE
     # set of ints (game ids), set of Players or ints (player ids),
@@ -365,10 +388,25 @@ class defensive_rtg_Q(Question):
         Question.__init__(self, games=games, on_court=on_court,
                           not_on_court=not_on_court)
         self.requested_players = requested_players if requested_players else set()
+
+    # OVERRIDE
+    # [no args] -> [void]
+    def clear_totals(self):
+        Question.clear_totals(self)
         # In addition to action_totals which is for the requested players:
         self.team_actions_totals =     defaultdict(int)
         self.opponent_actions_totals = defaultdict(int)
 
+    # OVERRIDE
+    # defensive_rtg_Q -> returns defensive_rtg_Q
+    def merge(self, partial):
+        Question.merge(self, partial)
+        for a_id, total in partial.team_actions_totals.iteritems():
+            self.team_actions_totals[a_id] += total
+        for a_id, total in partial.opponent_actions_totals.iteritems():
+            self.opponent_actions_totals[a_id] += total
+        return self
+
     # OVERRIDE
     # StatsObject -> [void]
     def get_attrs_from_SO(self, SO):
@@ -385,27 +423,19 @@ class defensive_rtg_Q(Question):
             self, self.requested_players, roster)
 
     # OVERRIDE
-    # Play, int -> [void]
-    def add_data_as_applicable(self, play, game_id):
+    # Player, int, int -> [void]
+    def add_action_data(self, player, a_id, count=1):
         """Increment each total as according to the requested attributes."""
         
-        lineup_is_correct_ans = self.lineup_is_correct(play.both_lineups())
-        if lineup_is_correct_ans:
-            self.games_played_in.add(game_id)
-            player = play.player
-            a_id =   play.a_id
-            # Record all requested player actions actions:
-            if player in self.requested_players:
-                self.actions_totals[a_id] += 1
-            # Record all team actions:
-            if player.s_id == self.player_school:
-                self.team_actions_totals[a_id] += 1
-            # Record all opponent team actions:
-            else:
-                self.opponent_actions_totals[a_id] += 1
-        
-        self.update_timeline(play.time, play.section,
-                             lineup_is_correct_ans, game_id)
+        # Record all requested player actions actions:
+        if player in self.requested_players:
+            self.actions_totals[a_id] += count
+        # Record all team actions:
+        if player.s_id == self.player_school:
+            self.team_actions_totals[a_id] += count
+        # Record all opponent team actions:
+        else:
+            self.opponent_actions_totals[a_id] += count
     
     # OVERRIDE
     # [no args] -> returns [basic info, float]
@@ -415,30 +445,28 @@ class defensive_rtg_Q(Question):
         basic_info = Question.get_results(self)
         
         MP = self.get_minutes_played()
-        STL = self.calculate_totals("STL", self.actions_totals)
-        BLK = self.calculate_totals("BLK", self.actions_totals)
-        DREB = self.calculate_totals("DREB", self.actions_totals)
-        PF = self.calculate_totals("foul", self.actions_totals)
+        # Every type total of each dict comes from one matrix product.
+        player = self.catalog.type_totals(self.actions_totals)
+        team = self.catalog.type_totals(self.team_actions_totals)
+        opponent = self.catalog.type_totals(self.opponent_actions_totals)
+        STL = player["STL"]
+        BLK = player["BLK"]
+        DREB = player["DREB"]
+        PF = player["foul"]
         
         team_MP = self.SO.length_of_games(self.games_played_in)
-        team_OREB = self.calculate_totals("OREB", self.team_actions_totals)
-        team_DREB = self.calculate_totals("DREB", self.team_actions_totals)
-        team_FGM = self.calculate_totals("FGM", self.team_actions_totals)
-        team_FGA = self.calculate_totals("FGA", self.team_actions_totals)
-        team_FTA = self.calculate_totals("FTA", self.team_actions_totals)
-        team_STL = self.calculate_totals("STL", self.team_actions_totals)
-        team_BLK = self.calculate_totals("BLK", self.team_actions_totals)
-        team_TOV = self.calculate_totals("TOV", self.team_actions_totals)
-        team_PF = self.calculate_totals("foul", self.team_actions_totals)
+        team_DREB = team["DREB"]
+        team_STL = team["STL"]
+        team_BLK = team["BLK"]
+        team_PF = team["foul"]
         
         opponent_MP = team_MP
-        opponent_OREB = self.calculate_totals("OREB", self.opponent_actions_totals)
-        opponent_DREB = self.calculate_totals("DREB", self.opponent_actions_totals)
-        opponent_FGM = self.calculate_totals("FGM", self.opponent_actions_totals)
-        opponent_FGA = self.calculate_totals("FGA", self.opponent_actions_totals)
-        opponent_FTM = self.calculate_totals("FTM", self.opponent_actions_totals)
-        opponent_FTA = self.calculate_totals("FTA", self.opponent_actions_totals)
-        opponent_TOV = self.calculate_totals("TOV", self.opponent_actions_totals)
+        opponent_OREB = opponent["OREB"]
+        opponent_FGM = opponent["FGM"]
+        opponent_FGA = opponent["FGA"]
+        opponent_FTM = opponent["FTM"]
+        opponent_FTA = opponent["FTA"]
+        opponent_TOV = opponent["TOV"]
         opponent_PTS = self.calculate_points(self.opponent_actions_totals)
         
         try:        
@@ -454,15 +482,16 @@ class defensive_rtg_Q(Question):
          Stops2 = (((opponent_FGA - opponent_FGM - team_BLK) / team_MP) * FMwt * (1 - 1.07 * DOR_percent) +
                    ((opponent_TOV - team_STL) / team_MP)) * MP + (PF / team_PF) * 0.475*opponent_FTA * (1 - (opponent_FTM / opponent_FTA))**2
         
-         Team_possessions = 0.5 * ((team_FGA + 0.475*team_FTA - 1.07*(team_OREB / (team_OREB + opponent_DREB)) * (team_FGA - team_FGM) + team_TOV) +
-                             (opponent_FGA + 0.475*opponent_FTA - 1.07*(opponent_OREB / (opponent_OREB + team_DREB)) * (opponent_FGA - opponent_FGM) +
-                             opponent_TOV))
+         # Team possessions and rating are the team's (see team_ratings()).
+         team_rtgs = team_ratings(self.catalog, self.team_actions_totals,
+                                  self.opponent_actions_totals)
+         Team_possessions = team_rtgs["possessions"]
         
          Stops = Stops1 + Stops2
         
          Stop_percent = (Stops * opponent_MP) / (Team_possessions * MP)
         
-         Team_defensive_rating = 100 * (opponent_PTS / Team_possessions)
+         Team_defensive_rating = team_rtgs["drtg"]
         
          D_Pts_per_ScPoss = opponent_PTS / (opponent_FGM + (1 - (1 - (opponent_FTM / opponent_FTA))**2) * opponent_FTA*0.475)
         
@@ -470,4 +499,47 @@ class defensive_rtg_Q(Question):
         
          return basic_info + [DRtg]
         except ZeroDivisionError:
-         return basic_info + [0]
\ No newline at end of file
+         return basic_info + [0]
+
+# ActionCatalog, {int (action ID): int}, same -> returns {string: float}
+def team_ratings(catalog, team_actions_totals, opponent_actions_totals):
+    """A team's possessions, offensive rating and defensive rating.
+    
+        The totals are each team's actions, like the team_actions_totals and
+    opponent_actions_totals of the Questions above, so any split of plays
+    works, eg a lineup's (see LineupExplorer.get_stats()). "possessions" is
+    defensive_rtg_Q's estimate (the average of both teams'), and "drtg" its
+    team defensive rating: the opponent's points per 100 possessions. "ortg"
+    is the team's own points per 100 possessions. offensive_rtg_Q's rating
+    is a player's points produced, which needs their own totals, so it isn't
+    one of these.
+        Raises ZeroDivisionError if an action the formulas divide by never
+    occurred.
+    """
+    
+    team = catalog.type_totals(team_actions_totals)
+    opponent = catalog.type_totals(opponent_actions_totals)
+    team_FGM = team["FGM"]
+    team_FGA = team["FGA"]
+    team_FTA = team["FTA"]
+    team_TOV = team["TOV"]
+    team_OREB = team["OREB"]
+    team_DREB = team["DREB"]
+    team_PTS = catalog.total_points(team_actions_totals)
+    
+    opponent_FGM = opponent["FGM"]
+    opponent_FGA = opponent["FGA"]
+    opponent_FTA = opponent["FTA"]
+    opponent_TOV = opponent["TOV"]
+    opponent_OREB = opponent["OREB"]
+    opponent_DREB = opponent["DREB"]
+    opponent_PTS = catalog.total_points(opponent_actions_totals)
+    
+    # Formula from http://www.basketball-reference.com/about/ratings.html
+    # Tweaked slightly to replace 0.4 with 0.475, as in offensive_rtg_Q.
+    Team_possessions = 0.5 * ((team_FGA + 0.475*team_FTA - 1.07*(team_OREB / (team_OREB + opponent_DREB)) * (team_FGA - team_FGM) + team_TOV) +
+                        (opponent_FGA + 0.475*opponent_FTA - 1.07*(opponent_OREB / (opponent_OREB + team_DREB)) * (opponent_FGA - opponent_FGM) +
+                        opponent_TOV))
+    return {"possessions": Team_possessions,
+            "ortg": 100 * (team_PTS / Team_possessions),
+            "drtg": 100 * (opponent_PTS / Team_possessions)}
\ No newline at end of file
@@ -0,0 +1,126 @@
+from __future__ import division
+from collections import defaultdict
+from LineupExplorer import LineupExplorer
+
+class OnOffReport:
+    """Every rostered Player's totals with them on the court and off it.
+
+        Each split used to take two Questions per Player (on_court={P} and
+    not_on_court={P}), each a scan of every game. Here one LineupExplorer
+    pass totals the combinations of sizes 0 and 1: the empty combination is
+    the school's whole games and each Player alone is their time on court.
+    Off the court is then the whole games minus on the court, so the whole
+    roster costs about as much as one Question.
+        Actions are split into the school's ("team") and the other team's
+    ("opponent"), the totals offensive_rtg_Q and defensive_rtg_Q keep, so
+    any stat LineupExplorer.get_stats() knows can be asked for, including
+    the team's possessions and ratings on and off (see
+    MulticondQuestion.team_ratings()). A player's own rating isn't one.
+
+        Instance attributes:
+    SO: StatsObject.
+    school_id: int.
+    explorer: LineupExplorer of sizes 0 and 1 of the school's games.
+    splits: {Player: {"on": totals, "off": totals}}, with totals as in
+        LineupExplorer.combinations, for every Player on the roster but
+        TEAM. Filled by run().
+    """
+
+    # StatsObject, int, set of ints (game IDs) -> [void]
+    def __init__(self, SO, school_id, games=None):
+        self.SO = SO
+        self.school_id = school_id
+        self.explorer = LineupExplorer(SO, school_id, sizes=(0, 1),
+                                       games=games)
+        self.splits = {}
+
+    # [no args] -> OnOffReport
+    def run(self):
+        """Find the on and off totals of every Player on the roster."""
+
+        self.explorer.explore()
+        whole = self.explorer.combinations[0].get(frozenset())
+        if whole is None: # No games with lineups.
+            whole = {"team": {}, "opponent": {}, "games": set(), "seconds": 0}
+        self.splits = {}
+        for P in self.SO.rosters.get(self.school_id, {}).itervalues():
+            # TEAM actions aren't a player's, and it's never on the court.
+            if P.last == "TEAM":
+                continue
+            on = self.explorer.combinations[1].get(frozenset([P]))
+            if on is None:
+                on = {"team": {}, "opponent": {}, "games": set(),
+                      "seconds": 0}
+            off = {"games": set(), "seconds": 0}
+            for side in ("team", "opponent"):
+                off[side] = defaultdict(int)
+                for a_id, total in whole[side].iteritems():
+                    if total - on[side].get(a_id, 0):
+                        off[side][a_id] = total - on[side].get(a_id, 0)
+            for g_id in whole["games"]:
+                G = self.SO.dict_of_Games[g_id]
+                seconds = G.get_seconds_with_lineup((), (P,))
+                off["seconds"] += seconds
+                if self.is_ever_off(G, P):
+                    off["games"].add(g_id)
+            self.splits[P] = {"on": on, "off": off}
+        return self
+
+    # Game, Player -> returns bool
+    def is_ever_off(self, G, P):
+        """Was the Player off the court for any Stint of the Game?"""
+
+        for starts, ends, bits in G.get_on_court_intervals().itervalues():
+            if bits.get(P, 0) != (1 << len(starts)) - 1:
+                return True
+        return False
+
+    # list of strings, bool -> returns {Player: {"on": list, "off": list}}
+    def get_results(self, stats, per_minute=False):
+        """The stats asked for (see LineupExplorer.get_stats()), on and off."""
+
+        return {P: {split: self.explorer.get_stats(totals, stats, per_minute)
+                    for split, totals in splits.iteritems()}
+                for P, splits in self.splits.iteritems()}
+
+# Just for debugging: time a school's on/off report and the two Questions per
+# Player it replaces, and check that the totals match.
+# int -> [void]
+def time_on_off_report(school_id=554):
+    import time
+    from StatsObject import StatsObject
+    from Question import Question
+    SO = StatsObject()
+    SO.add_games_from_school(school_id, bulk=True)
+    roster = SO.rosters[school_id].values()
+    # TEAM actions count toward the school's totals, but it gets no split.
+    players = [P for P in roster if P.last != "TEAM"]
+    start = time.time()
+    report = OnOffReport(SO, school_id).run()
+    report_time = time.time() - start
+    games = report.explorer.games
+    Qs = {}
+    for P in players:
+        Qs[P] = {"on": Question(games=games, on_court={P},
+                                who_made_action=roster),
+                 "off": Question(games=games, not_on_court={P},
+                                 who_made_action=roster)}
+    start = time.time()
+    SO.answer_Questions([Q for splits in Qs.itervalues()
+                         for Q in splits.itervalues()], use_index=False)
+    for splits in Qs.itervalues():
+        for Q in splits.itervalues():
+            Q.get_minutes_played()
+    questions_time = time.time() - start
+    mismatches = 0
+    for P in players:
+        for split, Q in Qs[P].iteritems():
+            totals = report.splits[P][split]
+            if (dict(Q.actions_totals) != dict(totals["team"]) or
+                Q.timelines.get_seconds() != totals["seconds"] or
+                Q.games_played_in != totals["games"]):
+                mismatches += 1
+                print "Mismatch:", P.p_id, split
+    print "report {r:.3f}s, {n} Questions {q:.3f}s".format(
+        r=report_time, n=2 * len(players), q=questions_time)
+    print "{m} of {n} splits differ".format(m=mismatches, n=2 * len(players))
@@ -15,6 +15,7 @@ class Play:
         if h_lineup is None: h_lineup = set()
         if a_lineup is None: a_lineup = set()
         self.lineups = {"home":frozenset(h_lineup), "away":frozenset(a_lineup)}
+        self.lineup_mask = 0 # int. Both lineups as a bitmask, see Game.
       
     # [no args] -> frozenset of Players  
     def both_lineups(self):
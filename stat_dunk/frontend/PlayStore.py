@@ -0,0 +1,142 @@
+from __future__ import division
+import sys
+from Play import Play
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class PlayStore:
+    """A Game's Plays stored column by column in NumPy arrays.
+
+        A list of Plays costs several heap objects per play (the Play, its
+    dict, its lineups dict, two frozensets and boxed ints). Here each column
+    is one array, and each distinct pair of lineups is stored once. The
+    columns are made straight from the db rows (see
+    Game.make_store_from_rows()), and Play objects are only made when asked
+    for with make_Plays(), eg for __str__/__repr__. Everything else reads
+    the columns.
+
+        Instance attributes:
+    players: list of Players. The player column holds indices into it.
+    actions_attributes: {int (action id): {see StatsObject}}.
+    play_id: int32 array.
+    player: int16 array. Indices into players.
+    a_id: int16 array (action ids).
+    time: int16 array (time remaining in the section).
+    section: int8 array.
+    lineup: int32 array. Indices into lineup_table.
+    lineup_table: list of {"home": frozenset of Players, "away": same}. Every
+        distinct pair of lineups in the game, in order of first appearance.
+    lineup_masks: list of ints. The bitmask (see Game) of each lineup_table
+        entry.
+    """
+
+    # list of Players, dict, list of tuples, list of ints, list of dicts,
+    #                                                list of ints -> [void]
+    def __init__(self, players, actions_attributes, rows, lineup,
+                 lineup_table, lineup_masks):
+        """Make the columns from play rows and the lineups of each.
+
+            rows are play_by_plays rows, (play_id, player_id, action_id,
+        time, section), and lineup the index in lineup_table of each one's
+        lineups.
+        """
+
+        if numpy is None:
+            raise ImportError("NumPy is needed for columnar play storage.")
+        self.players = players
+        self.actions_attributes = actions_attributes
+        self.lineup_table = lineup_table
+        self.lineup_masks = lineup_masks
+        player_index = {P.p_id: i for i, P in enumerate(players)}
+        self.play_id = numpy.array([row[0] for row in rows], numpy.int32)
+        self.player =  numpy.array([player_index[row[1]] for row in rows],
+                                   numpy.int16)
+        self.a_id =    numpy.array([row[2] for row in rows], numpy.int16)
+        self.time =    numpy.array([row[3] for row in rows], numpy.int16)
+        self.section = numpy.array([row[4] for row in rows], numpy.int8)
+        self.lineup =  numpy.array(lineup, numpy.int32)
+
+    # [no args] -> int
+    def __len__(self):
+        return len(self.play_id)
+
+    # int -> Play
+    def make_Play(self, i):
+        """Materialize the Play at index i."""
+
+        lineup = self.lineup[i]
+        lineups = self.lineup_table[lineup]
+        play = Play(int(self.play_id[i]), self.players[self.player[i]],
+                    int(self.a_id[i]), self.actions_attributes,
+                    int(self.time[i]), int(self.section[i]),
+                    lineups["home"], lineups["away"])
+        play.lineup_mask = self.lineup_masks[lineup]
+        return play
+
+    # [no args] -> list of Plays
+    def make_Plays(self):
+        """Materialize every Play, in order."""
+
+        return [self.make_Play(i) for i in range(len(self))]
+
+    # [no args] -> int
+    def nbytes(self):
+        """Approximate memory used by the arrays and the lineup table."""
+
+        arrays = (self.play_id, self.player, self.a_id, self.time,
+                  self.section, self.lineup)
+        size = sum(a.nbytes for a in arrays)
+        size += sys.getsizeof(self.lineup_table)
+        size += sys.getsizeof(self.lineup_masks)
+        size += sum(sys.getsizeof(m) for m in self.lineup_masks)
+        for lineups in self.lineup_table:
+            size += sys.getsizeof(lineups)
+            size += sum(sys.getsizeof(L) for L in lineups.itervalues())
+        return size
+
+# list of Plays, list of Players, dict -> returns PlayStore
+def store_from_plays(plays, players, actions_attributes):
+    """A PlayStore of Plays that already have their lineups and masks.
+
+        For Games whose lineups had to be found with Plays, and for
+    vectorized Questions over Games that aren't columnar.
+    """
+
+    lineup_index = {} # {(frozenset, frozenset): int}
+    lineup_table = []
+    lineup_masks = []
+    lineup = []
+    for p in plays:
+        key = (p.lineups["home"], p.lineups["away"])
+        if key not in lineup_index:
+            lineup_index[key] = len(lineup_table)
+            lineup_table += [p.lineups]
+            lineup_masks += [p.lineup_mask]
+        lineup += [lineup_index[key]]
+    rows = [(p.play_id, p.player.p_id, p.a_id, p.time, p.section)
+            for p in plays]
+    return PlayStore(players, actions_attributes, rows, lineup, lineup_table,
+                     lineup_masks)
+
+# list of Plays -> int
+def size_of_plays(plays):
+    """Approximate memory used by a list of Plays, to compare with nbytes().
+
+        Players and the actions dict are shared by every game, so they aren't
+    counted. Frozensets shared between Plays are only counted once.
+    """
+
+    size = sys.getsizeof(plays)
+    seen = set()
+    for p in plays:
+        size += sys.getsizeof(p) + sys.getsizeof(p.__dict__)
+        size += sys.getsizeof(p.lineups)
+        for value in (p.play_id, p.a_id, p.time, p.section, p.lineup_mask):
+            size += sys.getsizeof(value)
+        for L in p.lineups.itervalues():
+            if id(L) not in seen:
+                seen.add(id(L))
+                size += sys.getsizeof(L)
+    return size
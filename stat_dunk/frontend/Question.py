@@ -1,7 +1,14 @@
 from __future__ import division
+import copy
 from collections import defaultdict
+from ActionCatalog import get_catalog
 from Player import Player
 from StatsObject import StatsObject
+from Timeline import Timeline
+try:
+    import numpy
+except ImportError:
+    numpy = None # Only needed to answer Questions vectorized.
 
 """
 Question
@@ -34,8 +41,22 @@ class Question:
         more quickly. A dictionary mapping types (eg "missed_2FG" refers to one
         action; "FGA" (field goal attempt) refers to many actions, including
         "missed_2FG") to their total occurances similar to action_totals.
-    timelines: {int (game ID): {int (section): [span]}}. See comment below.
+        Every type is totalled at once when the first is asked for.
+    catalog: ActionCatalog of the StatsObject's actions.
+    timelines: Timeline. When the requested lineup was on the court.
+    on_mask: int. on_court as a bitmask of the Game being processed.
+    off_mask: int. not_on_court as a bitmask of the Game being processed.
+    lineup_masks: {int (game ID): (on_mask, off_mask)}.
+    lineup_group: list of Questions. This Question, and any others with the
+        same games and lineup filters that it adds data to as well. They share
+        its games_played_in and timelines (see share_lineup_filter()).
     """
+    
+    # Only Plays made by who_made_action Players can count toward the totals,
+    # so their posting lists can pick out the Plays to add (see
+    # StatsObject.answer_from_index). Child classes that count other Plays
+    # set this to False.
+    filters_by_who_made_action = True
 
     # set of ints (game ids), set of Players or ints (player ids),
     #     same as prev, same as prev, same as prev, same as prev,
@@ -54,10 +75,74 @@ class Question:
         self.how_to_calculate =  how_to_calculate  if how_to_calculate  else ()
         self.points_requested =  points_requested
         
+        self.lineup_masks = {}
+        self.clear_totals()
+        
+    # [no args] -> [void]
+    def clear_totals(self):
+        """Set everything added from Games back to empty.
+        
+            Child classes with more totals override this to clear them too.
+        """
+        
         self.games_played_in = set()
         self.actions_totals = defaultdict(int) # All actions default to 0
         self.type_totals = {}
-        self.timelines = {}
+        self.timelines = Timeline()
+        self.lineup_group = [self]
+        if hasattr(self, "minutes_played"):
+            del self.minutes_played
+        
+    # [no args] -> returns Question
+    def new_partial(self):
+        """An empty copy of this Question to be given some of its Games.
+        
+            Partials can be filled separately, even in other processes (see
+        StatsObject.answer_Questions()), and combined with merge(). Only
+        call get_results() on the merged Question.
+        """
+        
+        partial = copy.copy(self)
+        partial.clear_totals()
+        return partial
+        
+    # Question -> returns Question
+    def merge(self, partial):
+        """Add the totals of a partial of this Question to this one.
+        
+            The partials must have been given different Games. Merging is
+        associative and the order doesn't matter, so merging every partial
+        gives the same results as adding every Game to one Question.
+        """
+        
+        self.games_played_in |= partial.games_played_in
+        for a_id, total in partial.actions_totals.iteritems():
+            self.actions_totals[a_id] += total
+        self.timelines.merge(partial.timelines)
+        self.type_totals = {}
+        if hasattr(self, "minutes_played"):
+            del self.minutes_played
+        return self
+        
+    # [no args] -> dict
+    def __getstate__(self):
+        """Don't pickle the StatsObject (and all of its Games) with this.
+        
+            Methods can't be pickled, so how_to_calculate is pickled as each
+        method's class and name.
+        """
+        
+        state = self.__dict__.copy()
+        state["SO"] = None
+        state["how_to_calculate"] = tuple((method.im_class, method.__name__)
+                                          for method in self.how_to_calculate)
+        return state
+        
+    # dict -> [void]
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.how_to_calculate = tuple(getattr(cls, name)
+                                      for cls, name in self.how_to_calculate)
         
     # StatsObject -> [void]
     def get_attrs_from_SO(self, SO):
@@ -65,6 +150,7 @@ class Question:
         
         self.SO = SO
         self.actions_attributes = SO.actions_attributes
+        self.catalog = get_catalog(SO.actions_attributes)
         self.turn_p_ids_into_Players(SO.dict_of_Players)
             
     # {int (player ID): Player} -> [void]
@@ -88,39 +174,218 @@ class Question:
             else:                     players += [roster[P]]
         return frozenset(players)
     
+    # Question -> [void]
+    def share_lineup_filter(self, Q):
+        """Add data to Q too, which has the same games and lineup filters.
+        
+            Which Plays have correct lineups, and so games_played_in and the
+        timelines, only depend on those. They're found once by this Question,
+        and Q should no longer be given Games itself.
+        """
+        
+        self.lineup_group += [Q]
+        Q.games_played_in = self.games_played_in
+        Q.timelines = self.timelines
+        
+    # [no args] -> returns frozenset of Players or None
+    def group_who_made_action(self):
+        """Players whose Plays can count toward any Question in lineup_group.
+        
+            None if some Question counts Plays by anyone.
+        """
+        
+        players = frozenset()
+        for Q in self.lineup_group:
+            if not Q.filters_by_who_made_action:
+                return None
+            players |= Q.who_made_action
+        return players
+    
     """
     BEGIN PLAY DATA PROCESSING METHODS
     """
     
+    # Game -> [void]
+    def compile_lineup_masks(self, G):
+        """Turn on_court and not_on_court into bitmasks of this Game.
+        
+            This must be called before this Game's Plays are added. Players not
+        in the Game can't be on court, so if one is in on_court, the on mask
+        gets a bit no lineup has and never matches.
+        """
+        
+        try:
+            self.on_mask, self.off_mask = self.lineup_masks[G.g_id]
+            return
+        except KeyError:
+            pass
+        self.on_mask = 0
+        for P in self.on_court:
+            self.on_mask |= G.player_bits.get(P, 1 << len(G.player_bits))
+        self.off_mask = G.get_mask(P for P in self.not_on_court
+                                   if P in G.player_bits)
+        self.lineup_masks[G.g_id] = (self.on_mask, self.off_mask)
+    
+    # Game -> returns list of ints
+    def get_live_sections(self, G):
+        """The sections of a Game where every on_court Player appears."""
+        
+        self.compile_lineup_masks(G)
+        return [section for section, mask in G.section_masks.iteritems()
+                if (mask & self.on_mask) == self.on_mask]
+    
     # Play, int -> [void]
     def add_data_as_applicable(self, play, game_id):
         """If this Play meets the conditions asked, increment the total."""
         
-        lineup_is_correct_ans = self.lineup_is_correct(play.both_lineups())
+        lineup_is_correct_ans = self.lineup_is_correct(play.lineup_mask)
         if lineup_is_correct_ans:
             self.games_played_in.add(game_id)
-            if self.play_is_requested(play):
-                self.actions_totals[play.a_id] += 1
+            self.add_group_action_data(play.player, play.a_id)
                     
-        self.update_timeline(play.time, play.section,
-                             lineup_is_correct_ans, game_id)
+        self.timelines.add(play.time, play.section, lineup_is_correct_ans,
+                           game_id)
+        
+    # Game, {int: list of (int, int)}, iterable of ints -> [void]
+    def add_data_from_runs(self, G, runs, play_indices):
+        """Add a Game's data given which of its Plays have correct lineups.
+        
+            runs maps each section to add to the (first, last) index ranges of
+        its Plays with correct lineups, in order. play_indices are the Plays
+        with correct lineups that might count toward the totals. The timeline
+        is made from the edges of the runs, and comes out exactly as if
+        add_data_as_applicable() had been given every Play.
+        """
+        
+        for i in play_indices:
+            self.add_group_action_data(*G.get_action(i))
+        for section in sorted(runs):
+            if runs[section]:
+                self.games_played_in.add(G.g_id)
+            first_index = G.section_indices[section]
+            last_index = G.section_indices.get(section+1, len(G.plays)) - 1
+            for first, last in runs[section]:
+                if first > first_index:
+                    self.add_timeline_segment(G, section, first_index,
+                                              first - 1, False)
+                self.add_timeline_segment(G, section, first, last, True)
+                first_index = last + 1
+            if first_index <= last_index:
+                self.add_timeline_segment(G, section, first_index,
+                                          last_index, False)
+        
+    # Game -> [void]
+    def add_data_from_Game(self, G):
+        """Add every section of a Game this Question can match."""
+        
+        for section in self.get_live_sections(G):
+            self.add_data_from_stints(G, G.stints[section])
+        
+    # Game, list of Stints -> [void]
+    def add_data_from_stints(self, G, stints):
+        """Add a section's Stints (see Stint), checking each lineup only once.
+        
+            A Stint's Plays all have the same lineups, so they're either all
+        counted or all not, and the timeline only needs the Stint's first and
+        last times. This comes out exactly as if add_data_as_applicable() had
+        been given every Play.
+        """
+        
+        for stint in stints:
+            lineup_is_correct_ans = self.lineup_is_correct(stint.lineup_mask)
+            if lineup_is_correct_ans:
+                self.games_played_in.add(G.g_id)
+                for (player, a_id), count in stint.counts.iteritems():
+                    self.add_group_action_data(player, a_id, count)
+            self.timelines.add(stint.start_time, stint.section,
+                               lineup_is_correct_ans, G.g_id)
+            self.timelines.add(stint.end_time, stint.section,
+                               lineup_is_correct_ans, G.g_id)
+        
+    # Game, PlayStore, list of ints -> [void]
+    def add_data_from_arrays(self, G, store, sections):
+        """Add the given sections of a Game using its Plays' arrays.
+        
+            This is add_data_as_applicable() vectorized with NumPy: the lineup
+        check is done once per distinct pair of lineups and broadcast to every
+        Play as a boolean mask. The matching Plays are counted per (Player,
+        action) with one bincount, and only the nonzero counts are given to
+        add_action_data(), so child classes total them as usual. The timeline
+        only needs the Plays where the mask changes. The results are exactly
+        the same as giving every Play to add_data_as_applicable().
+        """
+        
+        lineup_ok = numpy.array([self.lineup_is_correct(mask)
+                                 for mask in store.lineup_masks], dtype=bool)
+        is_correct = lineup_ok[store.lineup]
+        if len(sections) == len(G.section_indices):
+            in_sections = numpy.ones(len(store), dtype=bool)
+        else:
+            in_sections = numpy.in1d(store.section, sections)
+        counted = is_correct & in_sections
+        if counted.any():
+            self.games_played_in.add(G.g_id)
+            num_actions = int(store.a_id.max()) + 1
+            keys = (store.player[counted].astype(numpy.int64) * num_actions +
+                    store.a_id[counted])
+            counts = numpy.bincount(keys)
+            for key in numpy.flatnonzero(counts):
+                player, a_id = divmod(int(key), num_actions)
+                self.add_group_action_data(store.players[player], a_id,
+                                           int(counts[key]))
+        # A run of Plays of the same type, all in one section, starts after
+        # each change of either. Only a run's first and last times matter.
+        changes = numpy.flatnonzero((is_correct[1:] != is_correct[:-1]) |
+                                    (store.section[1:] != store.section[:-1]))
+        firsts = [0] + (changes + 1).tolist()
+        lasts = changes.tolist() + [len(store) - 1]
+        run_sections = store.section[firsts].tolist()
+        run_types = is_correct[firsts].tolist()
+        times = store.time.tolist()
+        sections = set(sections)
+        for first, last, section, run_type in zip(firsts, lasts, run_sections,
+                                                  run_types):
+            if section in sections:
+                self.timelines.add(times[first], section, run_type, G.g_id)
+                self.timelines.add(times[last], section, run_type, G.g_id)
+        
+    # Player, int, int -> [void]
+    def add_group_action_data(self, player, a_id, count=1):
+        """Add an action with a correct lineup to every Question in the group."""
+        
+        for Q in self.lineup_group:
+            Q.add_action_data(player, a_id, count)
+        
+    # Player, int, int -> [void]
+    def add_action_data(self, player, a_id, count=1):
+        """Add count of one action, made with a correct lineup, to the totals.
+        
+            Child classes that record other totals override this.
+        """
+        
+        if self.action_is_requested(player, a_id):
+            self.actions_totals[a_id] += count
     
-    # frozenset of Players -> returns bool
-    def lineup_is_correct(self, both_lineups):
-        """Do the on_court and not_on_court sets match this Play?"""
+    # int -> returns bool
+    def lineup_is_correct(self, lineup_mask):
+        """Do the on_court and not_on_court sets match this Play?
+        
+            lineup_mask is the Play's bitmask of both lineups (see Game). This
+        is the same as on_court <= both_lineups and not_on_court.isdisjoint(
+        both_lineups), without making a set for every Play.
+        """
     
-        return (self.on_court <= both_lineups and
-                self.not_on_court.isdisjoint(both_lineups))
+        return ((lineup_mask & self.on_mask) == self.on_mask and
+                not lineup_mask & self.off_mask)
             
-    # Play -> returns bool
-    def play_is_requested(self, play):
+    # Player, int -> returns bool
+    def action_is_requested(self, player, a_id):
         """Did a requested Player make a requested action?
         
-            Having the whole Play is necessary for child classes with more
+            Having the action id is necessary for child classes with more
         specific tests, eg which action is made.
         """
         
-        player = play.player
         return (player in self.who_made_action and
                 player not in self.not_made_action)
                 
@@ -174,9 +439,7 @@ class Question:
     def calculate_points(self, actions_totals):
         """Get points of all actions from a specific dict."""
         
-        self.points = 0
-        for a_id, total in actions_totals.iteritems():
-            self.points += total * self.actions_attributes[a_id]["points"]
+        self.points = self.catalog.total_points(actions_totals)
         return self.points
             
     # [no args] -> int
@@ -262,147 +525,152 @@ class Question:
     def get_total_of_type(self, action_type):
         """Given an action type, get and store the total occurances."""
         
-        try:
-            return self.type_totals[action_type]
-        except KeyError:
-            total = self.calculate_totals(action_type, self.actions_totals)
-            self.type_totals[action_type] = total
-            return total
+        if not self.type_totals:
+            self.type_totals = self.catalog.type_totals(self.actions_totals)
+        return self.type_totals[action_type]
     
     # string, {int (action ID): int} -> int
     def calculate_totals(self, action_type, actions_totals):
-        """Given an action type, get the total occurances."""
+        """Given an action type, get the total occurances.
         
-        action_ids = self.get_action_ids_from_type(action_type)
-        total = sum([actions_totals[x] for x in action_ids])
-        self.type_totals[action_type] = total
-        return total
+            To get many types of the same dict, use catalog.type_totals()
+        once instead.
+        """
+        
+        return self.catalog.type_totals(actions_totals)[action_type]
         
     # string -> returns set of ints
     def get_action_ids_from_type(self, action_type):
-        """Get the set of action IDs associated with this type."""
+        """Get the set of action IDs associated with this type.
+        
+            Even the "supertypes" (eg FGA, FTA) are types (see ActionCatalog).
+        """
     
-        # This ensures that all types totals can be calculated with the
-        # same function, and that even the "supertypes" (eg FGA, FTA) can be
-        # stored in self.type_totals.
-        action_ids = set() # All action ids this type refers to.
-        if action_type == "FGA":
-            action_ids.update(StatsObject.get_all_ids_matching_type(
-                self.actions_attributes,
-                "made_2FG", "missed_2FG", "made_3FG", "missed_3FG"))
-        elif action_type == "FTA":
-            action_ids.update(StatsObject.get_all_ids_matching_type(
-                self.actions_attributes, "made_FT", "missed_FT"))
-        elif action_type == "FGM":
-            action_ids.update(StatsObject.get_all_ids_matching_type(
-                self.actions_attributes, "made_2FG", "made_3FG"))
-        else:
-            action_ids.update(StatsObject.get_all_ids_matching_type(
-                self.actions_attributes, action_type))
-        return action_ids
+        return set(self.catalog.get_ids(action_type))
         
     """
     END RESULT CALCULATION METHODS
     
     BEGIN TIMELINE METHODS
-        self.timelines is {int (game ID): {int (section): [span]}}
-        Each span is a dict with the following keys/values:
-          {"type": bool,    Is this lineup the one specified in this Question?
-           "start": int,    When this lineup type entered the court
-           "end": int}      When this lineup type left the court
-    So an example timeline might be: [{"type":True,"start":1200,"end":1185},
-    {"type":False,"start":1183,"end":70}, {"type":True,"start":70,"end":3}]
-        In this case, the lineup requested began on the court until 1185 and
-    reentered at 70 until the end of the section.
-        Note self.timelines[g_id][section][-1] refers to the most recent span.
+        See Timeline for how self.timelines records when the requested lineup
+    was on the court.
     """
-    
-    # int, bool, int -> [void]
-    def update_timeline(self, time, section, is_correct, g_id):
-        """Make a record of which minutes a given lineup was on the court."""
         
-        try:
-          # If this Play is the same type as the most recent one, just update
-          # the time that the lineup goes to.
-          if self.timelines[g_id][section][-1]["type"] is is_correct:
-              self.timelines[g_id][section][-1]["end"] = time
-          # Else, this play is a different type. Add a new span.
-          else:
-              span = {"type":is_correct, "start":time, "end":time}
-              self.timelines[g_id][section] += [span]
-        # No spans for this section, so add the first.
-        except KeyError:
-          begin_time = 1200 if section <=2 else 300
-          span = {"type": is_correct, "start": begin_time, "end": time}
-          try:
-            self.timelines[g_id][section] = [span]
-          # No entries for this game at all!            
-          except KeyError:
-            self.timelines[g_id] = {section: [span]}
+    # Game, int, int, int, bool -> [void]
+    def add_timeline_segment(self, G, section, first, last, is_correct):
+        """Add Plays first through last (indices in G), all the same type.
+        
+            Only the first and last Play's times matter to the timeline, so
+        this is the same as adding every one of them.
+        """
+        
+        self.timelines.add(int(G.play_times[first]), section, is_correct,
+                           G.g_id)
+        self.timelines.add(int(G.play_times[last]), section, is_correct,
+                           G.g_id)
         
     # [no args] -> returns float
     def get_minutes_played(self):
-        """Return the number of minutes played with the requested lineup."""
+        """Return the number of minutes played with the requested lineup.
+        
+            If every game asked about is still loaded, this comes from their
+        on-court intervals (see Game.get_seconds_with_lineup()) without the
+        timelines. Games that were streamed (see
+        StatsObject.stream_Questions()) are gone, so then it comes from the
+        timelines.
+        """
         
         try:
           return self.minutes_played
         except AttributeError:
-          seconds = 0
-          for game in self.timelines.itervalues():
-              for section in game.itervalues():
-                  # Iterate with an index because the compensate functions need
-                  # to look at previous or next spans.
-                  # Each section[i] is a span dict.
-                  for i in range(len(section)):
-                      lineup_is_correct = section[i]["type"]
-                      start_time =        section[i]["start"]
-                      end_time =          section[i]["end"]
-                      if lineup_is_correct:
-                          seconds += start_time - end_time
-                          seconds += self.error_compensate_left(section, i)
-                          seconds += self.error_compensate_right(section, i)
-          self.minutes_played = seconds / 60
+          games = getattr(getattr(self, "SO", None), "dict_of_Games", {})
+          if self.games and all(g_id in games for g_id in self.games):
+              self.minutes_played = sum(
+                  games[g_id].get_seconds_with_lineup(self.on_court,
+                                                      self.not_on_court)
+                  for g_id in self.games) / 60
+          else:
+              self.minutes_played = self.timelines.get_seconds() / 60
           return self.minutes_played
-    
-    # list of lists, int -> returns float
-    def error_compensate_left(self, timeline, i):
-        """Returns extra time a lineup might be on the court.
-        
-            This looks at the times between the current time span and the span
-        before it, and returns extra time as appropriate.
-        """
-            
-        # If there's nothing to the left to compensate: return 0, because all
-        # timelines start at the correct time.
-        if i == 0:
-            return 0
-        # Otherwise, return extra time in one of two ways:
-        #     1) If the previous span begins and ends at the same time, don't
-        # count it. (Lineups are sometimes poorly approximated for enter/leave
-        # plays, which is otherwise not a problem.) Return all the time between
-        # its end time and the current start time.
-        #     2) In most cases, simply return half the time between the
-        # previous end time and the current start time. Note that this is only
-        # an approximation!
-        elif timeline[i-1]["start"] == timeline[i-1]["end"]:
-            return (timeline[i-1]["end"] - timeline[i]["start"])
-        else:
-            return (timeline[i-1]["end"] - timeline[i]["start"]) / 2
-    
-    # list of lists, int -> returns float             
-    def error_compensate_right(self,timeline, i):
-        """See error_compensate_left - this is essentially flipped."""
-        
-        # If there's nothing to the right to compensate: return all the extra
-        # time, because there's no guarantee that the last span will end at 0.
-        if i == len(timeline)-1:
-            return timeline[i]["end"]
-        elif timeline[i+1]["start"] == timeline[i+1]["end"]:
-            return (timeline[i]["end"] - timeline[i+1]["start"])
-        else:
-            return (timeline[i]["end"] - timeline[i+1]["start"]) / 2
             
     """
     END TIMELINE METHODS
     """
 
+# Just for debugging: time the lineup check of a Question over every Play of
+# a StatsObject's Games with frozensets (the old way) and with bitmasks.
+# StatsObject, Question -> [void]
+def time_lineup_checks(SO, Q):
+    import time
+    Q.get_attrs_from_SO(SO)
+    plays = {G: G.get_Plays() for G in SO.dict_of_Games.itervalues()}
+    start = time.time()
+    for G in SO.dict_of_Games.itervalues():
+        for p in plays[G]:
+            both_lineups = p.both_lineups()
+            (Q.on_court <= both_lineups and
+             Q.not_on_court.isdisjoint(both_lineups))
+    sets_time = time.time() - start
+    start = time.time()
+    for G in SO.dict_of_Games.itervalues():
+        Q.compile_lineup_masks(G)
+        for p in plays[G]:
+            Q.lineup_is_correct(p.lineup_mask)
+    masks_time = time.time() - start
+    print "frozensets: {s:.3f}s, bitmasks: {m:.3f}s ({x:.1f}x)".format(
+        s=sets_time, m=masks_time, x=sets_time / masks_time)
+
+# Also for debugging: answer a Question about each Player of a school over its
+# whole season one Play at a time, then vectorized, and check that the results
+# match. Posting lists are off so every Question takes the path being timed.
+# int -> [void]
+def time_vectorized_answers(school_id=554):
+    import time
+    SO = StatsObject()
+    SO.add_games_from_school(school_id, bulk=True)
+    roster = [P for P in SO.dict_of_Players.itervalues()
+              if P.s_id == school_id]
+    for G in SO.dict_of_Games.itervalues():
+        G.get_play_store() # Don't time making the arrays.
+    results = {}
+    for vectorized in (False, True):
+        Qs = [Question(games=set(SO.dict_of_Games), on_court={P},
+                       who_made_action=set(roster)) for P in roster]
+        start = time.time()
+        results[vectorized] = SO.answer_Questions(Qs, use_index=False,
+                                                  vectorized=vectorized)
+        print "vectorized={v}: {n} Questions in {s:.3f}s".format(
+            v=vectorized, n=len(Qs), s=time.time() - start)
+    print "results match:", results[False] == results[True]
+
+# Also for debugging: find the minutes of every pair of a school's Players
+# on court with another off, from the timelines and from the Games' on-court
+# intervals, and check that they match.
+# int -> [void]
+def time_minutes_queries(school_id=554):
+    import time
+    import itertools
+    SO = StatsObject()
+    SO.add_games_from_school(school_id, bulk=True)
+    roster = sorted((P for P in SO.dict_of_Players.itervalues()
+                     if P.s_id == school_id), key=lambda P: P.p_id)
+    Qs = [Question(games=set(SO.dict_of_Games), on_court=set(pair),
+                   not_on_court={R})
+          for pair in itertools.combinations(roster[:8], 2)
+          for R in roster[:8] if R not in pair]
+    SO.answer_Questions(Qs)
+    for G in SO.dict_of_Games.itervalues():
+        G.get_on_court_intervals() # Don't time making the intervals.
+    for Q in Qs:
+        Q.__dict__.pop("minutes_played", None)
+    start = time.time()
+    from_timelines = [Q.timelines.get_seconds() / 60 for Q in Qs]
+    timelines_time = time.time() - start
+    start = time.time()
+    from_intervals = [Q.get_minutes_played() for Q in Qs]
+    intervals_time = time.time() - start
+    per_game = 1e6 * intervals_time / (len(Qs) * len(SO.dict_of_Games))
+    print "{n} Questions: timelines {t:.3f}s, intervals {i:.3f}s".format(
+        n=len(Qs), t=timelines_time, i=intervals_time)
+    print "{u:.1f} microseconds per game".format(u=per_game)
+    print "minutes match:", from_timelines == from_intervals
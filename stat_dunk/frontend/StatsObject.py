@@ -1,8 +1,14 @@
 from __future__ import division
-import psycopg2
 import itertools
-from Game import Game
+import multiprocessing
+import time
+from bisect import bisect_left
+from operator import itemgetter
+import db
+from ActionCatalog import get_catalog
+from Game import Game, build_game, save_stints, save_stint_rows
 from Player import Player
+from PlayStore import size_of_plays
 
 class StatsObject:
     """This stores Game objects and distributes Questions to them.
@@ -10,18 +16,56 @@ class StatsObject:
         Instance attributes:
     dict_of_Games:      {int (game id):   Game}.
     dict_of_Players:    {int (player id): Player}.
+    rosters:            {int (school id): {int (player id): Player}}. The
+                        Players of each school loaded, so a school's roster
+                        is found without looking through every Player.
     actions_attributes: {int (action id): {see actions_attributes()}}.
+    cache:              GameCache or None. If given, Games, rosters and
+                        actions are taken from it before the db, and
+                        everything loaded from the db is put in it.
+    columnar:           bool. Store each Game's plays in a PlayStore.
+    lineup_engine:      string. How Games find missing lineups (see Game).
+    save_lineups:       bool. Save the lineups found for games missing them
+                        in lineup_stints. If False, only the read-only pool
+                        is used and they're kept in memory, until
+                        backfill_lineups.py reaches those games.
+    pending_games:      {int (game id): (int, int) (home, away school ids)}.
+                        Games added lazily that haven't been loaded yet.
+    on_court_index:     {int (player id): {int (game id): list of ints}}.
+                        The sorted indices of the Plays in each game with
+                        the Player on court.
+    action_index:       {int (player id): {int (game id): list of ints}}.
+                        The same, for Plays the Player made.
+    indexed_games:      set of ints (game ids) in the two indexes above.
+    game_lengths:       {int (game id): int}. The minutes of each game, kept
+                        after streamed Games are dropped (see
+                        length_of_games() and stream_Questions()).
     """
     
-    # [no args] -> [void]
-    def __init__(self):
-        conn = psycopg2.connect("dbname=game_data user=michael")
-        cur = conn.cursor()
+    # GameCache, bool, string, bool -> [void]
+    def __init__(self, cache=None, columnar=False, lineup_engine="nearest",
+                 save_lineups=True):
         self.dict_of_Games = {}
         self.dict_of_Players = {}
-        self.actions_attributes = self.make_action_attrs(cur)
-        cur.close()
-        conn.close()
+        self.rosters = {}
+        self.cache = cache
+        self.columnar = columnar
+        self.lineup_engine = lineup_engine
+        self.save_lineups = save_lineups
+        self.pending_games = {}
+        self.on_court_index = {}
+        self.action_index = {}
+        self.indexed_games = set()
+        self.game_lengths = {}
+        if cache is not None and cache.actions_attributes is not None:
+            self.actions_attributes = cache.actions_attributes
+            return
+        with db.connection(read_only=not self.save_lineups) as conn:
+            cur = conn.cursor()
+            self.actions_attributes = self.make_action_attrs(cur)
+            cur.close()
+        if cache is not None:
+            cache.actions_attributes = self.actions_attributes
     
     # [no args] -> {int: dict(see body)}
     def make_action_attrs(self, cur):
@@ -48,57 +92,318 @@ class StatsObject:
     def add_roster(self, cur, school_id):
         """Add a school's Players to dict_of_Players."""
         
-        # If there are already Players from this school, do nothing.
-        for P in self.dict_of_Players.itervalues():
-            if P.s_id == school_id:
-                return
+        self.add_rosters(cur, (school_id,))
+        
+    # cursor, iterable of ints -> [void]
+    def add_rosters(self, cur, school_ids):
+        """Add the Players of many schools, with one query for all of them.
+        
+            Schools already loaded, or in the cache, aren't queried.
+        """
+        
+        missing = set()
+        for school_id in school_ids:
+            if school_id in self.rosters:
+                continue
+            roster = None
+            if self.cache is not None:
+                roster = self.cache.get_roster(school_id)
+            if roster is None:
+                missing.add(school_id)
+            else:
+                self.add_Players(roster, school_id)
+        if not missing:
+            return
                 
         cur.execute("""
            SELECT player_id, school_id, last_name, first_name, title
-           FROM players WHERE school_id = %s""",
-           (school_id,))
+           FROM players WHERE school_id IN %s""",
+           (tuple(missing),))
+        rosters = {school_id: {} for school_id in missing}
         for row in cur.fetchall():
             p_id =  row[0]
             s_id =  row[1]
             last =  row[2]
             first = row[3]
             title = row[4]
-            self.dict_of_Players[p_id] = Player(p_id, s_id, last, first, title)
+            rosters[s_id][p_id] = Player(p_id, s_id, last, first, title)
+        for school_id, roster in rosters.iteritems():
+            if self.cache is not None:
+                roster = self.cache.put_roster(school_id, roster)
+            self.add_Players(roster, school_id)
+                
+    # {int (player id): Player}, int -> [void]
+    def add_Players(self, players, school_id=None):
+        """Add Players to dict_of_Players and rosters.
+        
+            If school_id is given, players is that school's whole roster.
+        Otherwise each Player goes in its own school's roster.
+        """
+        
+        self.dict_of_Players.update(players)
+        if school_id is not None:
+            self.rosters.setdefault(school_id, {}).update(players)
+            return
+        for p_id, P in players.iteritems():
+            self.rosters.setdefault(P.s_id, {})[p_id] = P
+            
+    # int, int -> returns {int (player id): Player}
+    def get_game_roster(self, home_id, away_id):
+        """The Players of both schools in a game, which must be loaded."""
+        
+        roster = dict(self.rosters[home_id])
+        roster.update(self.rosters[away_id])
+        return roster
 
-    # int -> [void]
-    def add_games_from_school(self, school_id):
-        """Add all a school's games to dict_of_Games via add_game()."""
+    # int, bool, bool, bool -> [void]
+    def add_games_from_school(self, school_id, bulk=False, lazy=False,
+                              parallel=False):
+        """Add all a school's games to dict_of_Games via add_game().
+        
+            If bulk is True, the plays of every game are loaded in a single
+        query by add_games_in_bulk() rather than one query per game. If
+        parallel is True, they're loaded in bulk and built by a pool of
+        processes (see build_games_in_parallel()).
+            If lazy is True, only the school's roster is loaded now. Its games
+        go in pending_games, and each one is loaded (in bulk) the first time a
+        Question given to answer_Questions asks about it.
+            With a cache, a school whose games are all cached needs no
+        connection at all.
+        """
         
-        conn = psycopg2.connect("dbname=game_data user=michael")
+        game_rows = None
+        if self.cache is not None:
+            game_rows = self.cache.get_school_games(school_id)
+        if game_rows is not None:
+            self.check_cached_games(row[0] for row in game_rows)
+            for row in game_rows:
+                self.add_game_from_cache(row[0])
+            if all(row[0] in self.dict_of_Games for row in game_rows):
+                return
+        
+        with db.connection(read_only=not self.save_lineups) as conn:
+            cur = conn.cursor()
+            if game_rows is None:
+                cur.execute("""
+                    SELECT game_id, home_school_id, away_school_id
+                    FROM games WHERE %s IN (home_school_id, away_school_id)""",
+                    (school_id,))
+                game_rows = cur.fetchall()
+                if self.cache is not None:
+                    self.cache.put_school_games(school_id, game_rows)
+            
+            if lazy:
+                self.add_roster(cur, school_id)
+                for row in game_rows:
+                    if row[0] not in self.dict_of_Games:
+                        self.pending_games[row[0]] = (row[1], row[2])
+            elif bulk or parallel:
+                self.add_games_in_bulk(conn, game_rows, parallel)
+            else:
+                for row in game_rows:
+                    self.add_game(g_id=row[0], conn=conn,
+                                  home_id=row[1], away_id=row[2])
+            cur.close()
+        
+    # iterable of ints -> [void]
+    def load_pending_games(self, g_ids=None):
+        """Load the given pending games, or all of them if g_ids is None."""
+        
+        if g_ids is None:
+            g_ids = list(self.pending_games)
+        game_rows = [(g_id,) + self.pending_games.pop(g_id) for g_id in g_ids
+                     if g_id in self.pending_games]
+        self.check_cached_games(row[0] for row in game_rows)
+        game_rows = [row for row in game_rows
+                     if not self.add_game_from_cache(row[0])]
+        if not game_rows:
+            return
+        with db.connection(read_only=not self.save_lineups) as conn:
+            self.add_games_in_bulk(conn, game_rows)
+        
+    # connection, list of (int, int, int), bool, int -> [void]
+    def add_games_in_bulk(self, conn, game_rows, parallel=False,
+                          processes=None):
+        """Add many games to dict_of_Games with one query for all plays.
+        
+            game_rows are (game id, home school id, away school id). The
+        rosters of every school and the lineup stints of every game are
+        fetched with one query each, and the plays are streamed through a
+        server-side cursor ordered by game, then split into each game's rows
+        and given to add_game(), so the Games are identical to ones loaded
+        individually. The lineups found for any of them are saved together
+        at the end (see Game.save_stint_rows()).
+            If parallel is True, each game's plays are handed to a pool of
+        processes (one per core, or processes) as they're streamed, and the
+        Games are made from the payloads the workers build (see
+        build_games_in_parallel()).
+        """
+        
+        game_rows = [row for row in game_rows
+                     if row[0] not in self.dict_of_Games]
+        if not game_rows:
+            return
+        schools = {row[0]: (row[1], row[2]) for row in game_rows}
+        cur = conn.cursor()
+        self.add_rosters(cur, itertools.chain(*schools.itervalues()))
+        versions = {}
+        if self.cache is not None:
+            versions = self.get_game_versions(cur, schools)
+        cur.close()
+        stints = self.get_stints_in_bulk(conn, schools)
+        games = self.stream_plays(conn, schools)
+        if parallel:
+            games = self.build_games_in_parallel(games, schools, stints,
+                                                 processes)
+        else:
+            games = ((g_id, rows, None) for g_id, rows in games)
+        
+        new_stints = {} # {int (game id): list of lineup_stints rows}
+        for g_id, rows, payload in games:
+            home_id, away_id = schools.pop(g_id)
+            self.add_game(g_id, conn=conn, home_id=home_id, away_id=away_id,
+                          rows=rows, stint_rows=stints[g_id],
+                          version=versions.get(g_id), payload=payload)
+            G = self.dict_of_Games[g_id]
+            # The workers have no connection, so save what they found here.
+            if payload is not None:
+                if payload["stint_rows"] is not None:
+                    new_stints[g_id] = payload["stint_rows"]
+            elif G.has_new_lineups:
+                new_stints[g_id] = G.get_stint_rows()
+        # Games with no plays at all never showed up in the query.
+        for g_id, (home_id, away_id) in schools.iteritems():
+            self.add_game(g_id, conn=conn, home_id=home_id, away_id=away_id,
+                          rows=[], stint_rows=[], version=versions.get(g_id))
+        if self.save_lineups:
+            cur = conn.cursor()
+            save_stint_rows(cur, new_stints)
+            cur.close()
+            conn.commit() # Commit inserts made into the lineup_stints table.
+        
+    # connection, iterable of ints -> {int (game id): list of tuples}
+    def get_stints_in_bulk(self, conn, g_ids):
+        """Get the lineup_stints rows of every game, in the form Game reads."""
+        
+        # There are only tens of stints per game, so fetch them all at once.
+        stints = {g_id: [] for g_id in g_ids}
         cur = conn.cursor()
         cur.execute("""
-            SELECT game_id, home_school_id, away_school_id
-            FROM games WHERE %s IN (home_school_id, away_school_id)""",
-            (school_id,))
-        game_rows = cur.fetchall()
+            SELECT game_id, first_play_id, last_play_id, home_lineup,
+                away_lineup
+            FROM lineup_stints
+            WHERE game_id IN %s ORDER BY game_id, first_play_id""",
+            (tuple(stints),))
+        for row in cur:
+            stints[row[0]] += [row[1:]]
+        cur.close()
+        return stints
+        
+    # connection, iterable of ints -> generator of (int, list of tuples)
+    def stream_plays(self, conn, g_ids):
+        """Yield each game's id and play rows, in order of game id.
+        
+            Games with no plays are skipped.
+        """
         
-        for row in game_rows:
-            self.add_game(g_id=row[0], conn=conn, home_id=row[1], away_id=row[2])
+        # A named cursor streams the rows instead of fetching them all first.
+        cur = conn.cursor("bulk_plays")
+        cur.execute("""
+            SELECT game_id, play_id, player_id, action_id, time, section
+            FROM play_by_plays
+            WHERE game_id IN %s ORDER BY game_id, play_id""",
+            (tuple(g_ids),))
+        for g_id, rows in itertools.groupby(cur, key=itemgetter(0)):
+            yield g_id, [row[1:] for row in rows]
         cur.close()
-        conn.close()
+        
+    # connection, iterable of ints
+    #               -> generator of (int, list of tuples, list of tuples)
+    def stream_games(self, conn, g_ids):
+        """Yield each game's id, play rows and stint rows, in order of game id.
+        
+            The stints are streamed through a second server-side cursor
+        alongside stream_plays(), so neither is ever fetched all at once.
+        The rows are in the form Game reads. Games with no plays are skipped.
+        """
+        
+        cur = conn.cursor("bulk_stints")
+        cur.execute("""
+            SELECT game_id, first_play_id, last_play_id, home_lineup,
+                away_lineup
+            FROM lineup_stints
+            WHERE game_id IN %s ORDER BY game_id, first_play_id""",
+            (tuple(g_ids),))
+        stints = itertools.groupby(cur, key=itemgetter(0))
+        next_stints = next(stints, None)
+        for g_id, rows in self.stream_plays(conn, g_ids):
+            while next_stints is not None and next_stints[0] < g_id:
+                next_stints = next(stints, None)
+            stint_rows = []
+            if next_stints is not None and next_stints[0] == g_id:
+                stint_rows = [row[1:] for row in next_stints[1]]
+                next_stints = next(stints, None)
+            yield g_id, rows, stint_rows
+        cur.close()
+        
+    # iterable of (int, list of tuples), {int: (int, int)},
+    #      {int: list of tuples}, int, bool -> generator of (int, None, dict)
+    def build_games_in_parallel(self, games, schools, stints, processes=None,
+                                lineups_only=False):
+        """Build Games from streamed play rows in a pool of processes.
+        
+            Making a Game (its Plays, lineups, masks, and any missing lineups)
+        is CPU-bound, so each game's rows are handed to one process per core
+        (or processes) as they come from games, never all fetched first.
+        Each worker gets a game's rows, stint rows, roster and actions, and
+        returns a payload (see Game.build_game()), never a Game, StatsObject
+        or connection. Yield each game's id, no rows and its payload, in the
+        order of games. If lineups_only, the payloads only have the stint
+        rows to save. The schools' rosters must already be loaded.
+        """
+        
+        tasks = ((g_id, schools[g_id][0], schools[g_id][1],
+                  self.get_game_roster(*schools[g_id]),
+                  self.actions_attributes, rows, stints[g_id],
+                  self.lineup_engine, lineups_only)
+                 for g_id, rows in games)
+        pool = multiprocessing.Pool(processes)
+        try:
+            for g_id, payload in pool.imap(build_game, tasks):
+                yield g_id, None, payload
+        finally:
+            pool.close()
+            pool.join()
     
-    # int, cursor, int, int, dict -> [void]
-    def add_game(self, g_id, conn=None, home_id=None,away_id=None, roster=None):
+    # int, cursor, int, int, dict, list of tuples, list of tuples, tuple,
+    #                                                         dict -> [void]
+    def add_game(self, g_id, conn=None, home_id=None,away_id=None, roster=None,
+                 rows=None, stint_rows=None, version=None, payload=None):
         """Add individual games to dict_of_Games.
         
             This can be called by add_games_from_school, or independently. If
-        called independently a new connection will have to be made and closed.
+        called independently a connection is checked out of the shared pool.
+        rows and stint_rows are this game's already loaded plays and lineup
+        stints (see add_games_in_bulk), or payload is the game built in a
+        worker process (see build_games_in_parallel()). version is the game's
+        version read before them (see get_game_versions()), for the cache.
         """
         
         # Do nothing if it's already in the StatsObject.
         if g_id in self.dict_of_Games:
             return
+        if rows is None and payload is None:
+            self.check_cached_games([g_id], conn)
+        if self.add_game_from_cache(g_id):
+            return
         if conn is None:
-            conn = psycopg2.connect("dbname=game_data user=michael")
-            must_close_conn = True
-        else:
-            must_close_conn = False
+            with db.connection(read_only=not self.save_lineups) as conn:
+                self.add_game(g_id, conn, home_id, away_id, roster, rows,
+                              stint_rows, version, payload)
+            return
         cur = conn.cursor()
+        if self.cache is not None and version is None:
+            version = self.get_game_versions(cur, [g_id]).get(g_id)
         
         if home_id is None or away_id is None:
             cur.execute("""
@@ -108,42 +413,348 @@ class StatsObject:
             home_id, away_id = cur.fetchone()
             
         # Ensure that the Player objects for this game are available.
-        self.add_roster(cur, home_id)
-        self.add_roster(cur, away_id)
-        # If there's no roster provided, make a new dict from Players with
-        # the right school IDs.
+        self.add_rosters(cur, (home_id, away_id))
+        # If there's no roster provided, use both schools' rosters.
         if roster is None:
-            roster = {p_id:P for p_id,P in self.dict_of_Players.iteritems()
-                      if P.s_id in (home_id, away_id)}
+            roster = self.get_game_roster(home_id, away_id)
                       
         # All actions dicts should be the same, so just use this object's.
         actions = self.actions_attributes
                 
         self.dict_of_Games[g_id] = Game(
             self, conn, g_id, home=home_id, away=away_id, roster=roster,
-            actions=actions)
+            actions=actions, rows=rows, stint_rows=stint_rows,
+            columnar=self.columnar, lineup_engine=self.lineup_engine,
+            save_lineups=self.save_lineups, payload=payload)
+        if self.cache is not None:
+            self.cache.put_game(self.dict_of_Games[g_id], version)
+        cur.close()
+        
+    # iterable of ints, connection -> [void]
+    def check_cached_games(self, g_ids, conn=None):
+        """Drop the cached Games of these whose rows changed in the db.
+        
+            Only Games due to be checked are (see GameCache), so usually
+        nothing is queried, and a connection is only checked out if one is.
+        """
+        
+        if self.cache is None:
+            return
+        due = self.cache.games_to_check(g_ids)
+        if not due:
+            return
+        if conn is None:
+            with db.connection(read_only=not self.save_lineups) as conn:
+                self.check_cached_games(due, conn)
+            return
+        cur = conn.cursor()
+        self.cache.check_games(due, self.get_game_versions(cur, due))
+        cur.close()
+        
+    # cursor, iterable of ints -> returns {int (game id): tuple}
+    def get_game_versions(self, cur, g_ids):
+        """A summary of each game's rows that changes whenever they do.
+        
+            New plays and stints get higher ids than any before, so with
+        their counts, any insert or delete changes it, and the sum of the
+        plays' player ids changes when aliases are merged (see
+        data_gathering/alias_utility.py). Deleted games are left out.
+        """
+        
+        cur.execute("""
+            SELECT g.game_id, P.num_plays, P.last_play_id, P.player_id_sum,
+                S.num_stints, S.last_stint_id
+            FROM games g
+            LEFT JOIN (
+                SELECT game_id, count(*) AS num_plays,
+                    max(play_id) AS last_play_id,
+                    sum(player_id) AS player_id_sum
+                FROM play_by_plays WHERE game_id IN %s
+                GROUP BY game_id) P ON P.game_id = g.game_id
+            LEFT JOIN (
+                SELECT game_id, count(*) AS num_stints,
+                    max(stint_id) AS last_stint_id
+                FROM lineup_stints WHERE game_id IN %s
+                GROUP BY game_id) S ON S.game_id = g.game_id
+            WHERE g.game_id IN %s""",
+            (tuple(g_ids),) * 3)
+        return {row[0]: tuple(row[1:]) for row in cur.fetchall()}
             
-        if must_close_conn:
-            cur.close()
-            conn.close()
+    # int -> returns bool
+    def add_game_from_cache(self, g_id):
+        """Add a cached Game and its Players. Return whether it was cached."""
+        
+        if self.cache is None:
+            return False
+        G = self.cache.get_game(g_id)
+        if G is None:
+            return False
+        # A Game's roster is both schools' whole rosters.
+        self.add_Players(G.roster)
+        self.dict_of_Games[g_id] = G
+        return True
+    
+    # Game -> [void]
+    def index_Game(self, G):
+        """Add a Game's Plays to on_court_index and action_index."""
+        
+        if G.g_id in self.indexed_games:
+            return
+        self.indexed_games.add(G.g_id)
+        for i, (player, _, _, _, lineups, _) in enumerate(G.play_values()):
+            self.action_index.setdefault(player.p_id, {}).setdefault(
+                G.g_id, []).append(i)
+            for lineup in lineups.itervalues():
+                for P in lineup:
+                    self.on_court_index.setdefault(P.p_id, {}).setdefault(
+                        G.g_id, []).append(i)
     
     # list of Questions -> list of list of ints 
-    def answer_Questions(self, list_of_Questions):
+    def answer_Questions(self, list_of_Questions, use_index=True,
+                         vectorized=False, processes=None):
         """Distribute Questions and return their answers.
         
-            Give each Question the roster so it can create Player objects. Then
-        distribute them to each Game.
+            Load any pending games the Questions ask about. Give each Question
+        the roster so it can create Player objects. Then distribute them to
+        each Game, as planned by plan_Questions(). Unless use_index is False,
+        selective Questions are answered from the posting lists instead (see
+        answer_from_index()). If vectorized, the rest are answered with NumPy
+        over each Game's arrays (see Game.add_data_to_Questions()). Questions
+        with the same lineup filters are only given each Game once (see
+        group_Questions()).
+            If processes is given, the Games are split among that many worker
+        processes instead. Each gets an empty partial of every Question,
+        and the filled partials are merged back (see Question.merge()).
             See Question.get_result() for the return format.
         """
         
+        requested_games = set()
+        for Q in list_of_Questions:
+            requested_games.update(Q.games)
+        self.load_pending_games(requested_games)
         for Q in list_of_Questions:
             Q.get_attrs_from_SO(self)
-        for G in self.dict_of_Games.itervalues():
-            G.add_data_to_Questions(list_of_Questions)
+        if processes:
+            self.answer_in_processes(list_of_Questions, processes)
+            return [Q.get_results() for Q in list_of_Questions]
+        plan = self.plan_Questions(self.group_Questions(list_of_Questions))
+        for g_id, routes in plan.iteritems():
+            G = self.dict_of_Games[g_id]
+            if use_index:
+                routes = self.answer_from_index(G, routes)
+            G.add_data_to_Questions(routes, vectorized)
         
         results = [Q.get_results() for Q in list_of_Questions]
         return results
         
+    # list of Questions, int -> [void]
+    def answer_in_processes(self, list_of_Questions, processes):
+        """Add the Games to the Questions in a pool of worker processes.
+        
+            Each worker is sent some of the Games and an empty partial of
+        every Question, pickled together so the Players they share stay the
+        same objects (Games and Questions leave out their StatsObject). The
+        partials each worker fills are merged into the Questions.
+        """
+        
+        g_ids = set()
+        for Q in list_of_Questions:
+            g_ids.update(g_id for g_id in Q.games
+                         if g_id in self.dict_of_Games)
+        g_ids = sorted(g_ids)
+        tasks = []
+        for i in range(processes):
+            games = [self.dict_of_Games[g_id] for g_id in g_ids[i::processes]]
+            if games:
+                tasks += [(games, [Q.new_partial()
+                                   for Q in list_of_Questions])]
+        pool = multiprocessing.Pool(processes)
+        try:
+            for partials in pool.imap_unordered(add_Games_to_partials, tasks):
+                for Q, partial in zip(list_of_Questions, partials):
+                    Q.merge(partial)
+        finally:
+            pool.close()
+            pool.join()
+        
+    # list of Questions -> returns list of Questions
+    def group_Questions(self, list_of_Questions):
+        """Group Questions with the same games, on_court and not_on_court.
+        
+            eg a request for several stats of one lineup makes a Question and
+        some MulticondQuestions that only differ in what they count. The first
+        of each group finds the Plays with correct lineups and the timeline
+        for all of them (see Question.share_lineup_filter()). Return the
+        first Question of each group, to be given the Games.
+            Groups are made anew each time, so Questions answered before
+        aren't left in their old groups as well.
+        """
+        
+        for Q in list_of_Questions:
+            Q.lineup_group = [Q]
+        firsts = {} # {(frozenset, frozenset, frozenset): Question}
+        grouped = []
+        for Q in list_of_Questions:
+            key = (frozenset(Q.games), Q.on_court, Q.not_on_court)
+            if key in firsts:
+                firsts[key].share_lineup_filter(Q)
+            else:
+                firsts[key] = Q
+                grouped += [Q]
+        return grouped
+        
+    # list of Questions -> {int (game id): {int (section): list of Questions}}
+    def plan_Questions(self, list_of_Questions):
+        """Route each Question to only the games and sections it can match.
+        
+            A Question gets a game's section only if it asks about the game and
+        every on_court Player is in some lineup of that section. Nothing from
+        the other sections could count toward its totals or minutes, so
+        skipping them doesn't change any answer. Games no Question needs are
+        left out of the plan entirely.
+        """
+        
+        plan = {}
+        for Q in list_of_Questions:
+            for g_id in Q.games:
+                G = self.dict_of_Games.get(g_id)
+                if G is None:
+                    continue
+                for section in Q.get_live_sections(G):
+                    plan.setdefault(g_id, {}).setdefault(section, []).append(Q)
+        return plan
+        
+    # Game, list of Questions -> returns {int (section): list of Questions}
+    def route_Game(self, G, list_of_Questions):
+        """plan_Questions() for one Game, which needn't be in dict_of_Games."""
+        
+        routes = {}
+        for Q in list_of_Questions:
+            if G.g_id in Q.games:
+                for section in Q.get_live_sections(G):
+                    routes.setdefault(section, []).append(Q)
+        return routes
+        
+    # list of Questions, bool -> list of list of ints
+    def stream_Questions(self, list_of_Questions, vectorized=False):
+        """Answer Questions about any number of games without keeping them.
+        
+            answer_Questions() needs every Game in dict_of_Games at once, so
+        memory grows with the games asked about. Here the plays and lineup
+        stints of the games are streamed, ordered by game (see
+        stream_games()). Each Game is made from its rows, added to the
+        Questions routed to it (see route_Game()) and dropped before the
+        next, so memory is bounded by the largest game, plus the Players and
+        game_lengths. Games already in dict_of_Games are used as they are.
+            Lineups missing from lineup_stints are found in memory, and saved
+        if save_lineups.
+            See Question.get_result() for the return format.
+        """
+        
+        g_ids = set()
+        for Q in list_of_Questions:
+            g_ids.update(Q.games)
+        if not g_ids:
+            return [Q.get_results() for Q in list_of_Questions]
+        with db.connection(read_only=not self.save_lineups) as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT game_id, home_school_id, away_school_id
+                FROM games WHERE game_id IN %s""",
+                (tuple(g_ids),))
+            schools = {row[0]: (row[1], row[2]) for row in cur.fetchall()}
+            self.add_rosters(cur, itertools.chain(*schools.itervalues()))
+            for Q in list_of_Questions:
+                Q.get_attrs_from_SO(self)
+            grouped = self.group_Questions(list_of_Questions)
+            for g_id, rows, stint_rows in self.stream_games(conn, schools):
+                G = self.dict_of_Games.get(g_id)
+                if G is None:
+                    home_id, away_id = schools[g_id]
+                    G = Game(self, conn, g_id, home=home_id, away=away_id,
+                             roster=self.get_game_roster(home_id, away_id),
+                             actions=self.actions_attributes, rows=rows,
+                             stint_rows=stint_rows, columnar=self.columnar,
+                             lineup_engine=self.lineup_engine)
+                    if G.has_new_lineups and self.save_lineups:
+                        save_stints(cur, [G])
+                self.game_lengths[g_id] = G.get_length()
+                G.add_data_to_Questions(self.route_Game(G, grouped),
+                                        vectorized)
+            cur.close()
+            if self.save_lineups:
+                conn.commit() # Commit inserts made into lineup_stints.
+        return [Q.get_results() for Q in list_of_Questions]
+        
+    # Game, {int: list of Questions} -> {int: list of Questions}
+    def answer_from_index(self, G, routes):
+        """Add a Game's data to selective Questions using the posting lists.
+        
+            A Question is selective if it has on_court Players, or its whole
+        lineup_group only counts who_made_action's Plays and it has no
+        not_on_court Players. Intersecting the on_court posting lists (and
+        dropping Plays with a not_on_court Player) gives the Plays with correct
+        lineups, and the action_index gives the ones made by who_made_action,
+        so only those Plays are touched. The rest of the routes are returned
+        to be scanned as usual.
+        """
+        
+        remaining = {}
+        selective = {}
+        for section, questions in routes.iteritems():
+            for Q in questions:
+                if Q.on_court or (Q.group_who_made_action() is not None and
+                                  not Q.not_on_court):
+                    selective.setdefault(Q, []).append(section)
+                else:
+                    remaining.setdefault(section, []).append(Q)
+        if not selective:
+            return routes
+        self.index_Game(G)
+        
+        for Q, sections in selective.iteritems():
+            Q.compile_lineup_masks(G)
+            bounds = {section: (G.section_indices[section],
+                                G.section_indices.get(section+1, len(G.plays)))
+                      for section in sections}
+            if Q.on_court:
+                postings = sorted(
+                    (self.on_court_index.get(P.p_id, {}).get(G.g_id, [])
+                     for P in Q.on_court), key=len)
+                correct = set(postings[0]).intersection(*postings[1:])
+                correct = sorted(i for i in correct
+                                 if not G.play_masks[i] & Q.off_mask)
+                runs = {}
+                for section, (begin, end) in bounds.iteritems():
+                    runs[section] = []
+                    for i in correct[bisect_left(correct, begin):
+                                     bisect_left(correct, end)]:
+                        if runs[section] and runs[section][-1][1] == i - 1:
+                            runs[section][-1] = (runs[section][-1][0], i)
+                        else:
+                            runs[section].append((i, i))
+            else:
+                # With no on_court or not_on_court, every Play is correct.
+                correct = None
+                runs = {section: [(begin, end - 1)]
+                        for section, (begin, end) in bounds.iteritems()}
+                
+            who_made_action = Q.group_who_made_action()
+            if who_made_action is not None:
+                play_indices = set()
+                for P in who_made_action:
+                    play_indices.update(
+                        self.action_index.get(P.p_id, {}).get(G.g_id, []))
+                if correct is not None:
+                    play_indices.intersection_update(correct)
+                play_indices = sorted(play_indices)
+            else:
+                play_indices = [i for section_runs in runs.itervalues()
+                                for first, last in section_runs
+                                for i in range(first, last + 1)]
+            Q.add_data_from_runs(G, runs, play_indices)
+        return remaining
+    
     # int, int -> set of frozensets of Players
     def get_combinations_size_n_from_school_lineups(self, n, school_id):
         """Get all combinations size n of Players of a team.
@@ -155,9 +766,11 @@ class StatsObject:
         """
         
         # All lineups of size 5 that have been used.
+        self.load_pending_games()
         lineups = set()
         for G in self.dict_of_Games.itervalues():
-            lineups.update(G.get_lineups(school_id))
+            if school_id in G.teams:
+                lineups.update(G.lineups[G.teams[school_id]])
         combinations_of_Players = set()
         for lineup in lineups:
             combos = [frozenset(i) for i in itertools.combinations(lineup, n)]
@@ -167,23 +780,16 @@ class StatsObject:
     # string -> int
     @staticmethod
     def get_one_id_matching_type(actions_attributes, action_type):
-        """Get the first action ID matching the type given."""
+        """Get the first action ID matching the type given (see ActionCatalog)."""
         
-        for action_id, attrs in actions_attributes.iteritems():
-            if attrs["type"] == action_type:
-                return action_id
+        return get_catalog(actions_attributes).first_id_of_type.get(action_type)
                 
     # string -> list of ints
     @staticmethod
     def get_all_ids_matching_type(actions_attributes, *action_types):
         """Get a list of all action IDs matching the type given."""
         
-        ids = []
-        types = tuple(action_types)
-        for action_id, attrs in actions_attributes.iteritems():
-            if attrs["type"] in types:
-                ids += [action_id]
-        return ids
+        return list(get_catalog(actions_attributes).get_ids(*action_types))
     
     # set of ints (game IDs) -> return int
     def length_of_games(self, game_ids):
@@ -191,12 +797,43 @@ class StatsObject:
     
         length = 0
         for game_id in game_ids:
-            num_sections = len(self.dict_of_Games[game_id].section_indices)
-            # The first two sections are 40 minutes; each one after is 5
-            length += 40 + (num_sections - 2)*5
+            if game_id not in self.game_lengths:
+                self.game_lengths[game_id] = (
+                    self.dict_of_Games[game_id].get_length())
+            length += self.game_lengths[game_id]
         return length
         
+    # set of ints (game IDs), set of ints or Players, set of ints or Players
+    #                                                   -> returns float
+    def minutes_with_lineup(self, game_ids, on_court, not_on_court=()):
+        """Minutes with on_court on and not_on_court off in these games.
+        
+            The games must be loaded. This is Question.get_minutes_played()
+        without a Question or any Plays scanned (see
+        Game.get_seconds_with_lineup()).
+        """
+        
+        on_court = {self.dict_of_Players.get(P, P) for P in on_court}
+        not_on_court = {self.dict_of_Players.get(P, P) for P in not_on_court}
+        return sum(self.dict_of_Games[g_id].get_seconds_with_lineup(
+                       on_court, not_on_court)
+                   for g_id in game_ids) / 60
+        
             
+# (list of Games, list of Questions) -> returns list of Questions
+def add_Games_to_partials(task):
+    """Add each Game to the partial Questions that ask about it.
+    
+        Run in a worker process by StatsObject.answer_in_processes().
+    """
+    
+    games, partials = task
+    for G in games:
+        for Q in partials:
+            if G.g_id in Q.games:
+                Q.add_data_from_Game(G)
+    return partials
+
 # string -> [void]
 def error_msg(error):
     """Prints to the terminal and writes an error to statsobject.txt."""
@@ -212,3 +849,132 @@ def getSO():
     for g in SO.dict_of_Games:
         print g
 
+# Also for debugging: compare the load time of a school's games one query per
+# game against one query for all of them. Lineups written by the first load
+# are read by the second, so run it twice and use the second line.
+# int -> [void]
+def time_bulk_load(school_id=554):
+    for bulk in (False, True):
+        SO = StatsObject()
+        start = time.time()
+        SO.add_games_from_school(school_id, bulk=bulk)
+        print "bulk={b}: {n} games in {s:.3f}s".format(
+            b=bulk, n=len(SO.dict_of_Games), s=time.time() - start)
+
+# Also for debugging: load a school's games stored as lists of Plays, or as
+# PlayStores, and print the load time, the growth of peak RSS and the memory
+# per game. Lineups are loaded from the db, so make sure they were already
+# written. Peak RSS never goes down, so run each mode in a fresh process.
+# int, bool -> [void]
+def compare_play_storage(school_id=554, columnar=True):
+    import resource
+    # ru_maxrss is in KB on Linux.
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    SO = StatsObject(columnar=columnar)
+    start = time.time()
+    SO.add_games_from_school(school_id, bulk=True)
+    seconds = time.time() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+    if columnar:
+        sizes = [G.plays.nbytes() for G in SO.dict_of_Games.itervalues()]
+    else:
+        sizes = [size_of_plays(G.plays) for G in SO.dict_of_Games.itervalues()]
+    print ("columnar={c}: {n} games loaded in {s:.3f}s, peak RSS +{m:.1f} "
+           "MB, {b:.0f} bytes/game").format(
+               c=columnar, n=len(sizes), s=seconds, m=peak / 1024,
+               b=sum(sizes) / max(len(sizes), 1))
+
+# Also for debugging: time building all of a school's games and finding their
+# lineups (as if none were in the db) in one process, then in one process per
+# core. Nothing is written to the db.
+# int -> [void]
+def time_parallel_lineups(school_id=554):
+    SO = StatsObject()
+    SO.add_games_from_school(school_id, lazy=True)
+    with db.connection() as conn:
+        cur = conn.cursor()
+        SO.add_rosters(cur, itertools.chain(*SO.pending_games.itervalues()))
+        cur.close()
+        no_stints = {g_id: [] for g_id in SO.pending_games}
+        for processes in (1, None):
+            start = time.time()
+            games = SO.stream_plays(conn, SO.pending_games)
+            payloads = list(SO.build_games_in_parallel(
+                games, SO.pending_games, no_stints, processes))
+            print "processes={p}: {n} games in {s:.3f}s".format(
+                p=processes or multiprocessing.cpu_count(), n=len(payloads),
+                s=time.time() - start)
+
+# Also for debugging: time first-time loads of a school's games with none of
+# their lineups in the db, once with the stints written one INSERT per row (as
+# before) and once with Game.save_stints(). The school's stints are deleted
+# before each load, so this rewrites them.
+# int -> [void]
+def time_stint_writes(school_id=554):
+    with db.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT game_id, home_school_id, away_school_id
+            FROM games WHERE %s IN (home_school_id, away_school_id)""",
+            (school_id,))
+        g_ids = tuple(row[0] for row in cur.fetchall())
+        cur.close()
+    for batched in (False, True):
+        with db.connection(read_only=False) as conn:
+            cur = conn.cursor()
+            cur.execute("DELETE FROM lineup_stints WHERE game_id IN %s",
+                        (g_ids,))
+            cur.close()
+            conn.commit()
+        start = time.time()
+        if batched:
+            StatsObject().add_games_from_school(school_id, bulk=True)
+        else:
+            SO = StatsObject(save_lineups=False)
+            SO.add_games_from_school(school_id, bulk=True)
+            with db.connection(read_only=False) as conn:
+                cur = conn.cursor()
+                for G in SO.dict_of_Games.itervalues():
+                    for row in G.get_stint_rows():
+                        cur.execute("""
+                            INSERT INTO lineup_stints (game_id, section,
+                                first_play_id, last_play_id, start_time,
+                                end_time, home_lineup, away_lineup)
+                            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)""",
+                            row)
+                cur.close()
+                conn.commit()
+        print "batched={b}: {n} games loaded cold in {s:.3f}s".format(
+            b=batched, n=len(g_ids), s=time.time() - start)
+
+# Also for debugging: answer a Question about every action in every game in
+# the db, with the Games streamed (see stream_Questions()) or all loaded first.
+# Peak RSS never goes down, so run each mode in a fresh process.
+# bool -> [void]
+def time_full_season(streaming=True):
+    import resource
+    from Question import Question
+    SO = StatsObject()
+    with db.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT game_id, home_school_id, away_school_id FROM games")
+        game_rows = cur.fetchall()
+        SO.add_rosters(cur, set(itertools.chain(*[row[1:]
+                                                  for row in game_rows])))
+        cur.close()
+    Q = Question(games=set(row[0] for row in game_rows),
+                 who_made_action=set(SO.dict_of_Players),
+                 how_to_calculate=[Question.calc_total])
+    start = time.time()
+    if streaming:
+        SO.stream_Questions([Q])
+    else:
+        with db.connection(read_only=False) as conn:
+            SO.add_games_in_bulk(conn, game_rows)
+        SO.answer_Questions([Q])
+    seconds = time.time() - start
+    # ru_maxrss is in KB on Linux.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print ("streaming={s}: {n} games in {t:.1f}s ({r:.0f} games/s), "
+           "peak RSS {m:.0f} MB").format(s=streaming, n=len(game_rows),
+           t=seconds, r=len(game_rows) / seconds, m=peak)
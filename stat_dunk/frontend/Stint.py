@@ -0,0 +1,54 @@
+from __future__ import division
+
+class Stint:
+    """A maximal run of Plays in one section with the same lineups.
+
+        Questions can check a Stint's lineup once instead of once per Play,
+    and add its counts all at once (see Question.add_data_from_stints).
+
+        Instance attributes:
+    section: int.
+    first: int. The index (in Game.plays) of the Stint's first Play.
+    last: int. The index of its last Play.
+    start_time: int. The time of the first Play.
+    end_time: int. The time of the last Play.
+    lineups: {"home": frozenset of Players, "away": frozenset of Players}.
+    lineup_mask: int. Both lineups as a bitmask (see Game).
+    counts: {(Player, int (action id)): int}. How many times each Player made
+        each action during the Stint.
+    """
+
+    # int, int, int, dict, int -> [void]
+    def __init__(self, section, first, time, lineups, lineup_mask):
+        """A Stint starting at the Play at index first, with no Plays yet.
+
+            The Plays are added with add_Play(), starting with that one.
+        """
+
+        self.section = section
+        self.first = first
+        self.last = first
+        self.start_time = time
+        self.end_time = time
+        self.lineups = lineups
+        self.lineup_mask = lineup_mask
+        self.counts = {}
+
+    # int, int, Player, int -> [void]
+    def add_Play(self, index, time, player, a_id):
+        """Extend the Stint through the Play at index, made by player."""
+
+        self.last = index
+        self.end_time = time
+        key = (player, a_id)
+        self.counts[key] = self.counts.get(key, 0) + 1
+
+    # [no args] -> int
+    def __len__(self):
+        return self.last - self.first + 1
+
+    # [no args] -> string
+    def __repr__(self):
+        return "{s}: plays {f}-{l}, {st}-{et}, {h} ||| {a}".format(
+            s=self.section, f=self.first, l=self.last, st=self.start_time,
+            et=self.end_time, h=self.lineups["home"], a=self.lineups["away"])
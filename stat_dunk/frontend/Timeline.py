@@ -0,0 +1,174 @@
+from __future__ import division
+from array import array
+try:
+    import numpy
+except ImportError:
+    numpy = None # Without it, seconds are counted span by span.
+
+class Timeline:
+    """When a Question's lineup was on the court, in each section of its games.
+
+        Each section is a list of spans: runs of Plays that all had the
+    Question's lineup on court (its type is True) or didn't (False), from
+    the time of the first Play to the time of the last. Consecutive Plays of
+    the same type extend the same span. eg a section of
+        type:  True  False True
+        start: 1200  1183  70
+        end:   1185  70    3
+    began with the lineup on court until 1185, and it reentered at 70 until
+    the end of the section. A section's first span starts when the section
+    does, 1200 (or 300 for overtimes).
+        Spans used to be a dict each. Here each section's types, starts and
+    ends are three arrays, and get_seconds() works on all of them at once.
+
+        Instance attributes:
+    sections: {(int, int) (game ID, section): (array of bools (types), array
+        of ints (starts), array of ints (ends))}. Every section but the open
+        one.
+    g_id, section: int. The open section, the one last added to. Plays come
+        a section at a time, so its spans are kept in lists, which are
+        quicker to add to, and only packed into arrays when another section
+        is added to (see close()).
+    types, starts, ends: lists of the open section's spans.
+    """
+
+    # [no args] -> [void]
+    def __init__(self):
+        self.sections = {}
+        self.g_id = None
+        self.section = None
+        self.types = self.starts = self.ends = None
+
+    # int, int, bool, int -> [void]
+    def add(self, time, section, is_correct, g_id):
+        """Record a Play's time and whether its lineup was the one asked for."""
+
+        if section != self.section or g_id != self.g_id:
+            if self.open(time, section, is_correct, g_id):
+                return
+        # If this Play is the same type as the most recent one, just update
+        # the time that the span goes to. Else, add a new span.
+        if self.types[-1] == is_correct:
+            self.ends[-1] = time
+        else:
+            self.types.append(is_correct)
+            self.starts.append(time)
+            self.ends.append(time)
+
+    # int, int, bool, int -> returns bool
+    def open(self, time, section, is_correct, g_id):
+        """Make a section the open one. Return whether it's new, in which case
+        its first span was made from the Play."""
+
+        self.close()
+        self.g_id = g_id
+        self.section = section
+        spans = self.sections.pop((g_id, section), None)
+        if spans is not None:
+            self.types, self.starts, self.ends = [list(a) for a in spans]
+            return False
+        begin_time = 1200 if section <= 2 else 300
+        self.types = [is_correct]
+        self.starts = [begin_time]
+        self.ends = [time]
+        return True
+
+    # [no args] -> [void]
+    def close(self):
+        """Pack the open section into arrays, so no section is open."""
+
+        if self.section is not None:
+            self.sections[(self.g_id, self.section)] = (
+                array("b", self.types), array("i", self.starts),
+                array("i", self.ends))
+        self.g_id = None
+        self.section = None
+        self.types = self.starts = self.ends = None
+
+    # Timeline -> [void]
+    def merge(self, other):
+        """Add the sections of another Timeline, of different games."""
+
+        self.close()
+        other.close()
+        self.sections.update(other.sections)
+
+    # [no args] -> dict
+    def __getstate__(self):
+        """Pickle every section packed."""
+
+        self.close()
+        return self.__dict__.copy()
+
+    # [no args] -> returns float or int
+    def get_seconds(self):
+        """The seconds the lineup asked for was on the court.
+
+            Each span of the lineup counts from its start to its end, plus
+        some of the time between it and the spans on either side, since the
+        lineup could have entered or left any time between them:
+            1) If the span beside it begins and ends at the same time, all of
+        the time between them. (Lineups are sometimes poorly approximated for
+        enter/leave plays, which is otherwise not a problem.)
+            2) In most cases, half the time between them. Note that this is
+        only an approximation!
+            Nothing is added before a section's first span, because all
+        timelines start at the correct time. All the time after its last span
+        is added, because there's no guarantee that it ends at 0.
+        """
+
+        self.close()
+        if not self.sections:
+            return 0
+        if numpy is None:
+            return sum(section_seconds(*spans)
+                       for spans in self.sections.itervalues())
+        types = numpy.concatenate([numpy.frombuffer(spans[0], numpy.int8)
+                                   for spans in self.sections.itervalues()])
+        starts = numpy.concatenate([numpy.frombuffer(spans[1], numpy.int32)
+                                    for spans in self.sections.itervalues()])
+        ends = numpy.concatenate([numpy.frombuffer(spans[2], numpy.int32)
+                                  for spans in self.sections.itervalues()])
+        lengths = [len(spans[0]) for spans in self.sections.itervalues()]
+        lasts = numpy.cumsum(lengths) - 1
+        is_last = numpy.zeros(len(types), bool)
+        is_last[lasts] = True
+        is_first = numpy.zeros(len(types), bool)
+        is_first[lasts[:-1] + 1] = True
+        is_first[0] = True
+        # Spans with no time, so all the time next to them is added.
+        is_point = starts == ends
+        half_or_all = numpy.where(is_point, 1.0, 0.5)
+
+        seconds = (starts - ends).astype(float)
+        left = numpy.zeros(len(types))
+        left[1:] = (ends[:-1] - starts[1:]) * half_or_all[:-1]
+        left[is_first] = 0
+        right = numpy.zeros(len(types))
+        right[:-1] = (ends[:-1] - starts[1:]) * half_or_all[1:]
+        right[is_last] = ends[is_last]
+        seconds += left + right
+        return float(seconds[types.astype(bool)].sum())
+
+# sequence of bools, sequence of ints, sequence of ints -> returns float or int
+def section_seconds(types, starts, ends):
+    """Timeline.get_seconds() of one section's spans, span by span."""
+
+    seconds = 0
+    last = len(types) - 1
+    for i in range(len(types)):
+        if not types[i]:
+            continue
+        seconds += starts[i] - ends[i]
+        if i > 0:
+            if starts[i-1] == ends[i-1]:
+                seconds += ends[i-1] - starts[i]
+            else:
+                seconds += (ends[i-1] - starts[i]) / 2
+        if i == last:
+            seconds += ends[i]
+        elif starts[i+1] == ends[i+1]:
+            seconds += ends[i] - starts[i+1]
+        else:
+            seconds += (ends[i] - starts[i+1]) / 2
+    return seconds
@@ -0,0 +1,85 @@
+from __future__ import division
+import argparse
+import itertools
+import time
+import db
+from StatsObject import StatsObject
+from Game import save_stint_rows
+
+"""
+Find the lineups of every game missing some, and save them in lineup_stints.
+    This is the only place lineups are meant to be written: the web views
+only read them (see StatsObject.save_lineups), and find the lineups of games
+not backfilled yet in memory. Run it after new play by plays are put in the
+db.
+    Games are done in batches. Each batch's plays are streamed to a pool of
+processes that find the lineups (see StatsObject.build_games_in_parallel()),
+and the stint rows they send back are saved together and committed. No Games
+are made here. The games left are the progress: stopping and running again
+picks up after the last committed batch.
+"""
+
+# connection -> list of (int, int, int)
+def get_games_missing_lineups(conn):
+    """(game id, home id, away id) of every game with a play in no stint."""
+
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT g.game_id, g.home_school_id, g.away_school_id
+        FROM games g
+        WHERE EXISTS (
+            SELECT 1 FROM play_by_plays pbp
+            WHERE pbp.game_id = g.game_id AND NOT EXISTS (
+                SELECT 1 FROM lineup_stints S
+                WHERE S.game_id = pbp.game_id
+                    AND pbp.play_id BETWEEN S.first_play_id
+                                        AND S.last_play_id))
+        ORDER BY g.game_id""")
+    game_rows = cur.fetchall()
+    cur.close()
+    return game_rows
+
+# connection, list of (int, int, int), int, string -> [void]
+def backfill_batch(conn, game_rows, processes=None, lineup_engine="nearest"):
+    """Find and save the lineups of a batch of games, then commit."""
+
+    # A StatsObject per batch, so Players of every school don't pile up.
+    SO = StatsObject(lineup_engine=lineup_engine)
+    schools = {row[0]: (row[1], row[2]) for row in game_rows}
+    cur = conn.cursor()
+    SO.add_rosters(cur, itertools.chain(*schools.itervalues()))
+    stints = SO.get_stints_in_bulk(conn, schools)
+    games = SO.stream_plays(conn, schools)
+    new_stints = {}
+    for g_id, _, payload in SO.build_games_in_parallel(
+            games, schools, stints, processes, lineups_only=True):
+        if payload["stint_rows"] is not None:
+            new_stints[g_id] = payload["stint_rows"]
+    save_stint_rows(cur, new_stints)
+    cur.close()
+    conn.commit()
+
+# int, int, string -> [void]
+def backfill(games_per_batch=200, processes=None, lineup_engine="nearest"):
+    with db.connection(read_only=False) as conn:
+        game_rows = get_games_missing_lineups(conn)
+        print str(len(game_rows)) + " games missing lineups"
+        start = time.time()
+        for i in range(0, len(game_rows), games_per_batch):
+            backfill_batch(conn, game_rows[i:i + games_per_batch], processes,
+                           lineup_engine)
+            done = min(i + games_per_batch, len(game_rows))
+            print "{d} of {n} games done in {s:.1f}s".format(
+                d=done, n=len(game_rows), s=time.time() - start)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find and save the lineups "
+                                     "of every game missing some.")
+    parser.add_argument("--games-per-batch", type=int, default=200)
+    parser.add_argument("--processes", type=int, default=None,
+                        help="worker processes (default: one per core)")
+    parser.add_argument("--engine", default="nearest",
+                        choices=["nearest", "substitutions"],
+                        help="how lineups are found (see Game)")
+    args = parser.parse_args()
+    backfill(args.games_per_batch, args.processes, args.engine)
@@ -0,0 +1,194 @@
+from __future__ import division
+import os
+import threading
+import time
+from contextlib import contextmanager
+import psycopg2
+
+"""
+Shared database connection pools.
+    There are two pools: a read-only one as the sd_readonly user (for the web
+views) and a read-write one (for anything that writes, eg lineups). Both are
+created on first use and kept for the life of the process, so requests reuse
+warm connections instead of connecting and disconnecting every time.
+    The DSNs, pool sizes and checkout timeout can be set with the environment
+variables below, or by calling configure() before the pools are first used.
+"""
+
+settings = {
+    "read_only_dsn":  os.environ.get("STATDUNK_READ_ONLY_DSN",
+                                     "dbname=game_data user=sd_readonly"),
+    "read_write_dsn": os.environ.get("STATDUNK_READ_WRITE_DSN",
+                                     "dbname=game_data user=michael"),
+    "min_size":       int(os.environ.get("STATDUNK_POOL_MIN", 1)),
+    "max_size":       int(os.environ.get("STATDUNK_POOL_MAX", 10)),
+    "timeout":        float(os.environ.get("STATDUNK_POOL_TIMEOUT", 5)),
+}
+pools = {} # {bool (read only): ConnectionPool}
+pools_lock = threading.Lock()
+
+class PoolTimeout(Exception):
+    """No connection was returned to a full pool before the timeout."""
+
+
+class ConnectionPool:
+    """A thread-safe pool of psycopg2 connections to one DSN.
+
+        Instance attributes:
+    dsn: string.
+    read_only: bool. Connections are put in read-only sessions.
+    min_size: int. Connections opened up front and always kept.
+    max_size: int. The most connections open at once.
+    timeout: float. Seconds get() waits for a connection before giving up.
+    idle: list of connections not checked out.
+    num_open: int. Connections open, checked out or not.
+    counters: {string: int}. Running totals reported by metrics().
+    retired: bool. The pool was closed (see configure()), so connections put
+        back are closed instead of kept.
+    """
+
+    # string, bool, int, int, float -> [void]
+    def __init__(self, dsn, read_only=False, min_size=1, max_size=10,
+                 timeout=5):
+        self.dsn = dsn
+        self.read_only = read_only
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.idle = []
+        self.num_open = 0
+        self.counters = {"checkouts": 0, "waits": 0, "timeouts": 0,
+                         "connects": 0, "discards": 0}
+        self.retired = False
+        self.condition = threading.Condition(threading.Lock())
+        for i in range(min_size):
+            self.idle.append(self.connect())
+            self.num_open += 1
+
+    # [no args] -> connection
+    def connect(self):
+        conn = psycopg2.connect(self.dsn)
+        if self.read_only:
+            conn.set_session(readonly=True)
+        with self.condition:
+            self.counters["connects"] += 1
+        return conn
+
+    # [no args] -> connection
+    def get(self):
+        """Check out a connection, waiting up to self.timeout for one."""
+
+        deadline = time.time() + self.timeout
+        with self.condition:
+            self.counters["checkouts"] += 1
+            if not self.idle and self.num_open >= self.max_size:
+                self.counters["waits"] += 1
+            while not self.idle and self.num_open >= self.max_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    self.counters["timeouts"] += 1
+                    raise PoolTimeout("No connection to {d} free after {t}s"
+                                      .format(d=self.dsn, t=self.timeout))
+                self.condition.wait(remaining)
+            if self.idle:
+                return self.idle.pop()
+            # Reserve the slot before connecting outside of the lock.
+            self.num_open += 1
+        try:
+            return self.connect()
+        except:
+            with self.condition:
+                self.num_open -= 1
+                self.condition.notify()
+            raise
+
+    # connection -> [void]
+    def put(self, conn):
+        """Return a checked out connection to the pool.
+
+            Anything left uncommitted is rolled back, so the next user always
+        starts with a clean transaction. Broken connections are discarded,
+        as are all connections once the pool is retired.
+        """
+
+        try:
+            if not conn.closed:
+                conn.rollback()
+        except psycopg2.Error:
+            conn.close()
+        with self.condition:
+            if self.retired and not conn.closed:
+                conn.close()
+            if conn.closed:
+                self.num_open -= 1
+                self.counters["discards"] += 1
+            else:
+                self.idle.append(conn)
+            self.condition.notify()
+
+    # [no args] -> {string: int}
+    def metrics(self):
+        """The pool's size and usage so far."""
+
+        with self.condition:
+            metrics = {"open":     self.num_open,
+                       "idle":     len(self.idle),
+                       "in_use":   self.num_open - len(self.idle),
+                       "max_size": self.max_size}
+            metrics.update(self.counters)
+            return metrics
+
+    # [no args] -> [void]
+    def close_all(self):
+        """Close the idle connections and retire the pool.
+
+            Connections checked out now are closed when they're put back.
+        """
+
+        with self.condition:
+            self.retired = True
+            for conn in self.idle:
+                conn.close()
+            self.num_open -= len(self.idle)
+            self.idle = []
+
+
+# **kwargs -> [void]
+def configure(**kwargs):
+    """Change settings. Pools already made are closed and remade on next use."""
+
+    with pools_lock:
+        settings.update(kwargs)
+        for pool in pools.itervalues():
+            pool.close_all()
+        pools.clear()
+
+# bool -> ConnectionPool
+def get_pool(read_only=True):
+    with pools_lock:
+        if read_only not in pools:
+            dsn = settings["read_only_dsn" if read_only else "read_write_dsn"]
+            pools[read_only] = ConnectionPool(
+                dsn, read_only=read_only, min_size=settings["min_size"],
+                max_size=settings["max_size"], timeout=settings["timeout"])
+        return pools[read_only]
+
+# bool -> context manager of connection
+@contextmanager
+def connection(read_only=True):
+    """Check a connection out of the shared pool for a with block."""
+
+    pool = get_pool(read_only)
+    conn = pool.get()
+    try:
+        yield conn
+    finally:
+        pool.put(conn)
+
+# [no args] -> {string: {string: int}}
+def pool_metrics():
+    """Metrics of every pool made so far, keyed "read_only"/"read_write"."""
+
+    with pools_lock:
+        return {"read_only" if read_only else "read_write": pool.metrics()
+                for read_only, pool in pools.iteritems()}
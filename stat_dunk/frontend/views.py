@@ -7,9 +7,10 @@ from .forms import QuestionBuilderForm
 from django.views.generic import View, FormView, TemplateView
 from error import write_error
 
-import psycopg2
+import db
 import json
 from StatsObject import StatsObject
+from GameCache import GameCache
 from Question import Question
 from MulticondQuestion import AST_rate_Q, REB_rate_Q, offensive_rtg_Q, defensive_rtg_Q
 
@@ -20,59 +21,62 @@ import time
 import string, random
 from statdunk.frontend.models import Uploaded_File
 
+# Games, rosters and actions loaded by any request, kept for later requests.
+# Plays and lineups are written by other processes, so cached Games are
+# checked against the db once they're a minute old (see GameCache).
+game_cache = GameCache(recheck_after=60)
+
 class QuestionBuilderView(FormView):
     template_name = "questionbuilder.html"
     form_class = QuestionBuilderForm
     
 def GetSchools(HttpRequest):
-    conn = psycopg2.connect("dbname=game_data user=sd_readonly")
-    cur = conn.cursor()
-    cur.execute("SELECT school_id, name FROM schools")
-    data = cur.fetchall()
-    cur.close()
-    conn.close()
+    with db.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT school_id, name FROM schools")
+        data = cur.fetchall()
+        cur.close()
     schools = {i[0]: i[1] for i in data} # {school id: name}
     return HttpResponse(json.dumps(schools))
 
 def GetSchoolInfo(HttpRequest, school_id):
     school_id = int(school_id)
-    conn = psycopg2.connect("dbname=game_data user=sd_readonly")
-    cur = conn.cursor()
+    with db.connection() as conn:
+        cur = conn.cursor()
     
-    cur.execute("""SELECT game_id, home_school_id, away_school_id, winner,
-                   home_score, away_score, date
-                   FROM games WHERE %s in (home_school_id, away_school_id)
-                   ORDER BY date""",
-                (school_id,))
+        cur.execute("""SELECT game_id, home_school_id, away_school_id, winner,
+                       home_score, away_score, date
+                       FROM games WHERE %s in (home_school_id, away_school_id)
+                       ORDER BY date""",
+                    (school_id,))
                 
-    # list of {"game_id": game id, "oppt_id": school id, "is_win": bool,
-    #          "team_score": int, "oppt_score": int, "year/month/day": int}
-    games = [{"game_id": i[0],
-              "oppt_id": i[1] if school_id != i[1] else i[2],
-              "is_win": True if school_id == i[3] else False,
-              "team_score": i[4] if school_id == i[1] else i[5],
-              "oppt_score": i[5] if school_id == i[1] else i[4],
-              "year": i[6].year,
-              "month": i[6].month,
-              "day": i[6].day}
-              for i in cur.fetchall()]
+        # list of {"game_id": game id, "oppt_id": school id, "is_win": bool,
+        #          "team_score": int, "oppt_score": int, "year/month/day": int}
+        games = [{"game_id": i[0],
+                  "oppt_id": i[1] if school_id != i[1] else i[2],
+                  "is_win": True if school_id == i[3] else False,
+                  "team_score": i[4] if school_id == i[1] else i[5],
+                  "oppt_score": i[5] if school_id == i[1] else i[4],
+                  "year": i[6].year,
+                  "month": i[6].month,
+                  "day": i[6].day}
+                  for i in cur.fetchall()]
               
-    cur.execute("""SELECT player_id, last_name, first_name, title
-                   FROM players
-                   WHERE school_id = %s AND last_name != 'TEAM'
-                   ORDER BY last_name""",
-                   (school_id,))
+        cur.execute("""SELECT player_id, last_name, first_name, title
+                       FROM players
+                       WHERE school_id = %s AND last_name != 'TEAM'
+                       ORDER BY last_name""",
+                       (school_id,))
                    
-    # list of {"player_id": player id, "last/first": last/first name, "title": None or title}
-    players = [{"player_id": i[0],
-                "last": i[1],
-                "first": i[2],
-                "title": i[3],
-                "school_id": school_id}
-                for i in cur.fetchall()]
+        # list of {"player_id": player id, "last/first": last/first name, "title": None or title}
+        players = [{"player_id": i[0],
+                    "last": i[1],
+                    "first": i[2],
+                    "title": i[3],
+                    "school_id": school_id}
+                    for i in cur.fetchall()]
                                 
-    cur.close()
-    conn.close()
+        cur.close()
     return HttpResponse(json.dumps({"games": games, "players": players}))
 
 # Everything but stats is represented by IDs of some sort, which are given as
@@ -166,10 +170,15 @@ def Calculate(HttpRequest):
         Q = Question(games=g, on_court=on_c, not_on_court=off_c, who_made_action=m_act,
                      not_made_action=n_m_act, how_to_calculate=question_methods)
                      
-        SO = StatsObject()
-        SO.add_games_from_school(school_id)
-        question_answers = SO.answer_Questions([Q])[0]
-        multicond_answers = SO.answer_Questions(multicond_questions)
+        # Requests only read lineups (see backfill_lineups.py). Games it
+        # hasn't reached yet get theirs found in memory, kept in the cache.
+        SO = StatsObject(cache=game_cache, save_lineups=False)
+        # Only the games the Questions ask about are loaded.
+        SO.add_games_from_school(school_id, lazy=True)
+        # All of them share one lineup filter, so answer them together.
+        answers = SO.answer_Questions([Q] + multicond_questions)
+        question_answers = answers[0]
+        multicond_answers = answers[1:]
         
         answers_in_order = []
         for stat in stats: